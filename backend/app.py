@@ -1,61 +1,358 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from data_loader import DataLoader
+from archive import SalesArchive
 from forecast import DemandForecaster
 from markdown_optimizer import MarkdownOptimizer
+from elasticity import ElasticityEstimator
+from redistribution import RedistributionPlanner
+from jobs import JobManager
+from ingestion import SalesIngestor
+from recommendations import RecommendationCache
+from change_feed import ChangeFeed
+from response_cache import ResponseCache
+from profiling import RequestProfiler
+from sharding import HashRing, ShardRouter, parse_shards
+import metrics
 import logging
 import os
-from datetime import datetime, timedelta
+import time
+import pandas as pd
+from datetime import datetime, timedelta, timezone
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that records serialization latency"""
+    
+    def dumps(self, obj, **kwargs):
+        with metrics.stage_latency.time(stage='json_serialization'):
+            return super().dumps(obj, **kwargs)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app, origins=['http://localhost:3000', 'http://localhost:5173'])
 
-# Initialize components
-data_loader = DataLoader()
-forecaster = DemandForecaster()
-markdown_optimizer = MarkdownOptimizer()
+# Sharding: SHARD_ID runs this process as one shard of SHARDS with its own data directory;
+# SHARDS without SHARD_ID runs it as the router in front of them
+SHARD_ID = os.environ.get('SHARD_ID')
+SHARDS = parse_shards(os.environ.get('SHARDS', ''))
+SHARD_ROUTER = bool(SHARDS) and not SHARD_ID
+if SHARD_ID:
+    if SHARDS and SHARD_ID not in SHARDS:
+        raise ValueError(f"SHARD_ID {SHARD_ID} is not listed in SHARDS")
+    shard_dir = os.path.join(os.environ.get('SHARD_DATA_DIR', 'data/shards'), SHARD_ID)
+    os.makedirs(shard_dir, exist_ok=True)
+    os.environ.setdefault('INVENTORY_DB', os.path.join(shard_dir, 'inventory.db'))
+    os.environ.setdefault('MODEL_CACHE_DIR', os.path.join(shard_dir, 'models'))
+    os.environ.setdefault('SALES_ARCHIVE_DIR', os.path.join(shard_dir, 'archive'))
 
-# Initialize database and seed sample data
-data_loader.seed_sample_data()
+# Initialize components; sales older than the retention window live in the Parquet archive
+SALES_ARCHIVE_DIR = os.environ.get('SALES_ARCHIVE_DIR', 'data/archive')
+SALES_RETENTION_DAYS = int(os.environ.get('SALES_RETENTION_DAYS', 120))
+SALES_ROLLUP_DAYS = int(os.environ.get('SALES_ROLLUP_DAYS', 730))
+CHANGE_FEED_HEARTBEAT = float(os.environ.get('CHANGE_FEED_HEARTBEAT_SECONDS', 15))
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
+if SHARD_ROUTER:
+    # The router holds no data: it loads nothing, trains nothing and runs no background work
+    data_loader = forecaster = markdown_optimizer = redistribution_planner = job_manager = None
+    change_feed = recommendation_cache = sales_ingestor = None
+else:
+    data_loader = DataLoader(os.environ.get('INVENTORY_DB', 'inventory.db'),
+                             archive=SalesArchive(SALES_ARCHIVE_DIR) if SALES_ARCHIVE_DIR else None)
+    forecaster = DemandForecaster(os.environ.get('MODEL_CACHE_DIR', 'models'),
+                                  model_type=os.environ.get('FORECAST_MODEL', 'per_sku'))
+    markdown_optimizer = MarkdownOptimizer(
+        mode=os.environ.get('MARKDOWN_MODE', 'point'),
+        n_scenarios=int(os.environ.get('MARKDOWN_SCENARIOS', 2000)),
+        risk_quantile=float(os.environ['MARKDOWN_RISK_QUANTILE']) if os.environ.get('MARKDOWN_RISK_QUANTILE') else None
+    )
+    redistribution_planner = RedistributionPlanner(
+        handling_cost=float(os.environ.get('REDISTRIBUTION_HANDLING_COST', 0.25)),
+        cost_per_km=float(os.environ.get('REDISTRIBUTION_COST_PER_KM', 0.01))
+    )
+    job_manager = JobManager(data_loader.db_path, chunk_size=int(os.environ.get('JOB_CHUNK_SIZE', 50)),
+                             lease_seconds=float(os.environ.get('JOB_LEASE_SECONDS', 60)))
+
+    # Push inventory and markdown changes to dashboards over server-sent events; events go
+    # through the database, so subscribers on every worker process see every write
+    change_feed = ChangeFeed(history_size=int(os.environ.get('CHANGE_FEED_HISTORY', 1000)), db_path=data_loader.db_path,
+                             poll_interval=float(os.environ.get('CHANGE_FEED_POLL_MS', 250)) / 1000)
+
+    recommendation_cache = RecommendationCache(data_loader, forecaster, markdown_optimizer,
+                                               max_entries=int(os.environ.get('RECOMMENDATION_CACHE_ENTRIES', 10000)))
+    sales_ingestor = SalesIngestor(data_loader,
+                                   max_batch=int(os.environ.get('SALES_BATCH_SIZE', 500)),
+                                   max_delay=float(os.environ.get('SALES_BATCH_DELAY_MS', 200)) / 1000)
+
+def cache_version():
+    """Cached responses depend on the data and on today's date (expiry days, forecast dates)"""
+    now = datetime.now(timezone.utc)
+    # SQLite's date('now') is UTC while forecasts use local dates
+    return (data_loader.data_version, now.date().isoformat(), now.astimezone().date().isoformat())
+
+# Serialized read responses with ETags and gzip, invalidated by any write; the router
+# caches nothing itself and passes shard ETags through
+response_cache = ResponseCache(cache_version,
+                               max_entries=0 if SHARD_ROUTER else int(os.environ.get('RESPONSE_CACHE_ENTRIES', 1024)),
+                               ttl=float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 30)))
+
+# The global model is refitted in the background after this many new sales rows
+FORECAST_REFIT_ROWS = int(os.environ.get('FORECAST_REFIT_ROWS', 5000))
+
+# Batches larger than this are processed as background jobs
+MARKDOWN_BATCH_SYNC_LIMIT = int(os.environ.get('MARKDOWN_BATCH_SYNC_LIMIT', 100))
+
+def fit_pooled_forecaster():
+    """Fit the catalog-wide forecasting model on all products' recent history"""
+    # Today is still in progress; Holt-Winters picks it up from ingestion once it is over
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    forecaster.fit_pooled(data_loader.get_all_sales_history(days=90), data_loader.get_product_categories(),
+                          through=yesterday)
+
+def refresh_elasticities(params, items):
+    """Estimate price elasticities for the whole catalog, store them and swap the lookup"""
+    estimator = ElasticityEstimator(priors=markdown_optimizer.price_elasticity_estimates,
+                                    shrinkage=params.get('shrinkage', 0.5))
+    sku_estimates, category_estimates = estimator.estimate(
+        data_loader.get_all_sales_history(days=params.get('days', 365)),
+        data_loader.get_product_categories()
+    )
+    version = data_loader.save_elasticities(sku_estimates, category_estimates)
+    # Other processes pick the new estimates up from the stored elasticity version
+    markdown_optimizer.load_elasticities(
+        dict(zip(sku_estimates['product_id'], sku_estimates['elasticity'])),
+        {c: e['elasticity'] for c, e in category_estimates.items()},
+        version=version
+    )
+    return [{'skus': len(sku_estimates), 'categories': category_estimates}]
+
+def refit_pooled_forecaster(params, items):
+    """Refit the catalog-wide model so it keeps up with new sales and new products"""
+    fit_pooled_forecaster()
+    return [{'model_type': forecaster.model_type, 'fitted_at': datetime.now().isoformat()}]
+
+def refit_forecaster_when_due(sales_df, data_version=None):
+    """Ingestion listener: queue a refit of the global model every FORECAST_REFIT_ROWS committed sales rows"""
+    if FORECAST_REFIT_ROWS > 0 and forecaster.rows_since_fit >= FORECAST_REFIT_ROWS:
+        forecaster.rows_since_fit = 0
+        job_manager.submit('forecast_refit', ['pooled'])
+
+def compact_sales_history(params, items):
+    """Move sales older than the retention window to the archive and roll up the oldest months"""
+    now = datetime.now()
+    before_date = (now - timedelta(days=params.get('retention_days', SALES_RETENTION_DAYS))).strftime('%Y-%m-%d')
+    rollup_month = (now - timedelta(days=params.get('rollup_days', SALES_ROLLUP_DAYS))).strftime('%Y-%m')
+    return [data_loader.archive_sales(before_date, rollup_month, vacuum=params.get('vacuum', False))]
+
+def compute_batch_markdown(product_ids, mode=None, risk_quantile=None):
+    """Compute markdown suggestions for every inventory lot of a list of product ids"""
+    products_data = data_loader.get_inventory(product_ids=list(dict.fromkeys(product_ids)))
+    lots = {}
+    for product in products_data:
+        lots.setdefault(product['product_id'], []).append(product)
+    
+    # Forecast each product once (the global model also covers products without history), then
+    # split it by store so every lot is weighed against its own store's demand
+    shares = data_loader.get_store_shares(list(lots))
+    forecasts_data = {}
+    for product_id, items in lots.items():
+        sales_df = data_loader.get_sales_history(product_id, days=90)
+        if not sales_df.empty or forecaster.model_type == 'global':
+            forecast = forecaster.forecast(product_id, sales_df, days=7, category=items[0]['category'])
+            for store_id, store_forecast in forecaster.split_by_store(
+                    forecast, shares.get(product_id), [item['store_id'] for item in items]).items():
+                forecasts_data[(product_id, store_id)] = store_forecast
+    
+    return markdown_optimizer.batch_optimize(products_data, forecasts_data, mode=mode, risk_quantile=risk_quantile)
+
+def forecast_store_demand(inventory_df, horizon_days):
+    """Forecast mean daily demand over the horizon per (store_id, product_id) for the products in inventory_df.
+    
+    Each product is forecast once and split across stores by their share of its
+    sales over the last 28 days, as for markdowns.
+    """
+    demand_df = data_loader.get_store_demand(days=28, product_ids=inventory_df['product_id'].unique().tolist())
+    if demand_df.empty:
+        return demand_df
+    
+    categories = inventory_df.groupby('product_id')['category'].first().to_dict()
+    history = data_loader.get_all_sales_history(days=90, product_ids=demand_df['product_id'].unique().tolist())
+    # One vectorized pass over the catalog rather than a forecast() call per product
+    forecast_demand = forecaster.forecast_demand(history, days=horizon_days, product_categories=categories)
+    
+    share = demand_df['daily_demand'] / demand_df.groupby('product_id')['daily_demand'].transform('sum')
+    # Products the forecaster could not cover keep their trailing mean
+    demand_df['daily_demand'] = (demand_df['product_id'].map(forecast_demand) * share).fillna(demand_df['daily_demand'])
+    return demand_df
+
+def parse_product_ids(data):
+    """Read the optional product_ids list from a JSON body; raises ValueError unless it is a list of strings"""
+    if not isinstance(data, dict):
+        raise ValueError('request body must be a JSON object')
+    product_ids = data.get('product_ids') or []
+    if not isinstance(product_ids, list) or not all(isinstance(pid, str) and pid for pid in product_ids):
+        raise ValueError('product_ids must be a list of product id strings')
+    return product_ids
+
+def parse_markdown_options(source):
+    """Read and validate markdown mode and risk_quantile from query args or a JSON body"""
+    mode = source.get('mode') or None
+    if mode is not None and mode not in MarkdownOptimizer.MODES:
+        raise ValueError(f"mode must be one of {', '.join(MarkdownOptimizer.MODES)}")
+    risk_quantile = source.get('risk_quantile')
+    if risk_quantile is not None:
+        # JSON bodies can carry lists, objects or booleans here; all of them are a client error
+        try:
+            if isinstance(risk_quantile, bool):
+                raise TypeError
+            risk_quantile = float(risk_quantile)
+        except (TypeError, ValueError):
+            raise ValueError('risk_quantile must be a number between 0 and 1')
+        if not 0 < risk_quantile < 1:
+            raise ValueError('risk_quantile must be between 0 and 1')
+    return mode, risk_quantile
+
+if not SHARD_ROUTER:
+    data_loader.add_change_listener(change_feed.publish)
+    change_feed.start()
+
+    # Initialize database and seed sample data
+    # Sample products would be duplicated on every shard, so sharded deployments load data explicitly
+    if os.environ.get('SEED_SAMPLE_DATA', 'false' if SHARDS or SHARD_ID else 'true').lower() not in ('0', 'false', 'no'):
+        data_loader.seed_sample_data()
+
+    if forecaster.model_type != 'per_sku':
+        fit_pooled_forecaster()
+
+    # Serve previously estimated elasticities from memory, reloading them when any process
+    # stores new ones; refresh with POST /elasticity/refresh
+    markdown_optimizer.track_elasticities(data_loader, float(os.environ.get('ELASTICITY_CHECK_SECONDS', 5)))
+
+    job_manager.register('markdown_batch', lambda params, product_ids: compute_batch_markdown(
+        product_ids, params.get('mode'), params.get('risk_quantile')))
+    job_manager.register('elasticity_refresh', refresh_elasticities)
+    job_manager.register('sales_compaction', compact_sales_history)
+    job_manager.register('forecast_refit', refit_pooled_forecaster)
+    job_manager.start()
+
+    # Compaction moves data out of SQLite, so it only runs on startup when asked for
+    if data_loader.archive is not None and os.environ.get('SALES_COMPACT_ON_START', '').lower() in ('1', 'true', 'yes'):
+        job_manager.submit('sales_compaction', ['all'])
+
+    # Each committed sales batch advances the forecaster, then refreshes only the SKUs it touched
+    sales_ingestor.add_listener(forecaster.on_sales_committed)
+    if forecaster.model_type == 'global':
+        sales_ingestor.add_listener(refit_forecaster_when_due)
+    sales_ingestor.add_listener(recommendation_cache.on_sales_committed)
+    sales_ingestor.start()
+
+    metrics.registry.gauge('forecast_coalesced_requests_total', 'Forecast requests served by an in-flight computation',
+                           lambda: forecaster.get_stats()['coalesced_requests'], metric_type='counter')
+    metrics.registry.gauge('cached_models', 'Forecast models held in memory',
+                           lambda: len(forecaster.models))
+    metrics.registry.gauge('change_feed_subscribers', 'Open server-sent event connections',
+                           lambda: len(change_feed.subscribers))
+    metrics.registry.gauge('sales_pending_events', 'Sale events buffered for the next micro-batch',
+                           sales_ingestor.pending)
+    metrics.registry.gauge('response_cache_entries', 'Serialized responses held by the response cache',
+                           lambda: len(response_cache.entries))
+    metrics.registry.gauge('recommendation_cached_products', 'Products with cached forecast and markdown',
+                           lambda: len(recommendation_cache.entries))
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.request_latency.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        metrics.requests_total.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    return response
+
+# Opt-in request profiling; nothing is registered unless enabled
+if os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes'):
+    RequestProfiler(top_n=int(os.environ.get('PROFILING_TOP_N', 25))).init_app(app)
+
+# The router forwards per-product requests to the owning shard and merges fan-out requests
+if SHARD_ROUTER:
+    ShardRouter(HashRing(SHARDS, vnodes=int(os.environ.get('SHARD_VNODES', 128))), SHARDS,
+                timeout=float(os.environ.get('SHARD_TIMEOUT_SECONDS', 30)),
+                sync_limit=MARKDOWN_BATCH_SYNC_LIMIT).init_app(app)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics endpoint"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+def service_status():
+    return {
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'version': '1.0.0'
-    })
+    }
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify(service_status())
+
+@app.route('/events', methods=['GET'])
+def stream_changes():
+    """Server-sent event stream of inventory, markdown and status changes"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    types = request.args.get('types')
+    event_types = set(types.split(',')) if types else None
+    
+    subscriber = change_feed.subscribe(last_event_id)
+    response = Response(stream_with_context(change_feed.stream(subscriber, service_status, CHANGE_FEED_HEARTBEAT,
+                                                               event_types)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/inventory', methods=['GET'])
+@response_cache.cached
 def get_inventory():
     """Get inventory data with optional filters"""
     try:
         # Get query parameters
         category = request.args.get('category')
         expiry_days = request.args.get('expiry_days', type=int)
+        store_id = request.args.get('store_id')
         
         # Get inventory data
-        inventory_data = data_loader.get_inventory(category=category, expiry_days=expiry_days)
+        inventory_data = data_loader.get_inventory_records(category=category, expiry_days=expiry_days,
+                                                           store_id=store_id)
         
         # Format response
-        formatted_data = []
-        for item in inventory_data:
-            formatted_data.append({
-                'productId': item['product_id'],
-                'productName': item['product_name'],
-                'category': item['category'],
-                'stock': item['stock'],
-                'expiryDate': item['expiry_date'],
-                'currentPrice': item['current_price'],
-                'status': item['status'],
-                'daysUntilExpiry': item['days_until_expiry']
-            })
+        formatted_data = [
+            {
+                'inventoryId': item.inventory_id,
+                'productId': item.product_id,
+                'productName': item.product_name,
+                'category': item.category,
+                'storeId': item.store_id,
+                'stock': item.stock,
+                'expiryDate': item.expiry_date,
+                'currentPrice': item.current_price,
+                'status': item.status,
+                'daysUntilExpiry': item.days_until_expiry
+            }
+            for item in inventory_data
+        ]
         
         return jsonify({
             'success': True,
@@ -73,6 +370,7 @@ def get_inventory():
         }), 500
 
 @app.route('/forecast/<product_id>', methods=['GET'])
+@response_cache.cached
 def get_forecast(product_id):
     """Get demand forecast for a specific product"""
     try:
@@ -80,29 +378,30 @@ def get_forecast(product_id):
         days = request.args.get('days', default=7, type=int)
         
         # Get sales history
-        sales_df = data_loader.get_sales_history(product_id, days=90)
+        history = data_loader.get_sales_history_array(product_id, days=90)
         
-        if sales_df.empty:
+        # The global model forecasts products without history from their category
+        category = data_loader.get_product_categories([product_id]).get(product_id)
+        if len(history) == 0 and (forecaster.model_type != 'global' or category is None):
             return jsonify({
                 'success': False,
                 'error': f'No sales history found for product {product_id}',
                 'timestamp': datetime.now().isoformat()
             }), 404
         
-        # Generate forecast
-        forecast_data = forecaster.forecast(product_id, sales_df, days=days)
+        # Generate forecast (the models take a DataFrame)
+        sales_df = pd.DataFrame(history)
+        forecast_data = forecaster.forecast(product_id, sales_df, days=days, category=category)
         
         # Get accuracy metrics if available
         accuracy_metrics = forecaster.get_forecast_accuracy(product_id, sales_df)
         
-        # Format historical data for chart
-        historical_data = []
-        for _, row in sales_df.tail(14).iterrows():  # Last 14 days
-            historical_data.append({
-                'date': row['date'],
-                'actual': row['units_sold'],
-                'predicted': None  # Historical data doesn't have predictions
-            })
+        # Format historical data for chart (last 14 days; history has no predictions)
+        recent = history[-14:]
+        historical_data = [
+            {'date': date, 'actual': units_sold, 'predicted': None}
+            for date, units_sold in zip(recent['date'].tolist(), recent['units_sold'].tolist())
+        ]
         
         # Combine historical and forecast data
         chart_data = historical_data + [
@@ -140,14 +439,24 @@ def get_forecast(product_id):
 def get_markdown_suggestion(product_id):
     """Get or update markdown suggestion for a product"""
     try:
-        # Get product data
-        inventory_data = data_loader.get_inventory()
-        product_data = next((item for item in inventory_data if item['product_id'] == product_id), None)
+        try:
+            mode, risk_quantile = parse_markdown_options(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        # Get product data: the earliest-expiring lot in store_id, or across all stores without it
+        store_id = request.args.get('store_id') or None
+        inventory_data = data_loader.get_inventory_records(store_id=store_id, product_ids=[product_id])
+        product_data = inventory_data[0] if inventory_data else None
         
         if not product_data:
             return jsonify({
                 'success': False,
-                'error': f'Product {product_id} not found',
+                'error': f'Product {product_id} not found' + (f' in store {store_id}' if store_id else ''),
                 'timestamp': datetime.now().isoformat()
             }), 404
         
@@ -155,11 +464,18 @@ def get_markdown_suggestion(product_id):
         sales_df = data_loader.get_sales_history(product_id, days=90)
         forecast_data = []
         
-        if not sales_df.empty:
-            forecast_data = forecaster.forecast(product_id, sales_df, days=7)
+        if not sales_df.empty or forecaster.model_type == 'global':
+            forecast_data = forecaster.forecast(product_id, sales_df, days=7, category=product_data['category'])
+            # The lot only sells through its own store's share of the product's demand
+            shares = data_loader.get_store_shares([product_id]).get(product_id)
+            forecast_data = forecaster.split_by_store(forecast_data, shares, [product_data.store_id])[product_data.store_id]
         
         # Generate markdown optimization
-        markdown_result = markdown_optimizer.optimize_markdown(product_data, forecast_data)
+        markdown_result = markdown_optimizer.optimize_markdown(product_data, forecast_data,
+                                                              mode=mode, risk_quantile=risk_quantile)
+        markdown_result['store_id'] = product_data.store_id
+        # Lots held by other stores get their own suggestion with ?store_id= (or from /markdown/batch)
+        markdown_result['other_stores'] = sorted({item.store_id for item in inventory_data} - {product_data.store_id})
         
         # If POST request, save the suggestion
         if request.method == 'POST':
@@ -185,27 +501,40 @@ def get_batch_markdown():
     """Get markdown suggestions for multiple products"""
     try:
         # Get request data
-        data = request.get_json()
-        product_ids = data.get('product_ids', [])
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            product_ids = parse_product_ids(data)
+            mode, risk_quantile = parse_markdown_options(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 400
         
         if not product_ids:
             # Get all products that need markdown (expiring soon)
             inventory_data = data_loader.get_inventory(expiry_days=3)
             product_ids = [item['product_id'] for item in inventory_data]
         
-        # Get product data
-        inventory_data = data_loader.get_inventory()
-        products_data = [item for item in inventory_data if item['product_id'] in product_ids]
-        
-        # Get forecasts for all products
-        forecasts_data = {}
-        for product_id in product_ids:
-            sales_df = data_loader.get_sales_history(product_id, days=90)
-            if not sales_df.empty:
-                forecasts_data[product_id] = forecaster.forecast(product_id, sales_df, days=7)
+        # Large batches run in the background; poll /jobs/<job_id> for results
+        if data.get('async') or len(product_ids) > MARKDOWN_BATCH_SYNC_LIMIT:
+            job_id = job_manager.submit('markdown_batch', product_ids,
+                                        {'mode': mode, 'risk_quantile': risk_quantile})
+            return jsonify({
+                'success': True,
+                'data': {
+                    'job_id': job_id,
+                    'status': 'pending',
+                    'total': len(product_ids),
+                    'status_url': f'/jobs/{job_id}'
+                },
+                'timestamp': datetime.now().isoformat()
+            }), 202
         
         # Generate batch markdown optimization
-        results = markdown_optimizer.batch_optimize(products_data, forecasts_data)
+        results = compute_batch_markdown(product_ids, mode, risk_quantile)
         
         return jsonify({
             'success': True,
@@ -222,7 +551,299 @@ def get_batch_markdown():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get status, progress and partial or final results of a background job"""
+    try:
+        include_results = request.args.get('results', default='true').lower() != 'false'
+        job = job_manager.get_job(job_id, include_results=include_results)
+        
+        if job is None:
+            return jsonify({
+                'success': False,
+                'error': f'Job {job_id} not found',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': job,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching job {job_id}: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/elasticity/refresh', methods=['POST'])
+def refresh_elasticity_estimates():
+    """Start a background job that re-estimates price elasticities from sales history"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            params = {
+                'days': int(data.get('days', 365)),
+                'shrinkage': float(data.get('shrinkage', 0.5))
+            }
+            if params['days'] < 1 or not 0 <= params['shrinkage'] < float('inf'):
+                raise ValueError
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            return jsonify({
+                'success': False,
+                'error': 'days must be a positive integer and shrinkage a non-negative number',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        job_id = job_manager.submit('elasticity_refresh', ['all'], params)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'job_id': job_id,
+                'status': 'pending',
+                'status_url': f'/jobs/{job_id}'
+            },
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error starting elasticity refresh: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/elasticity', methods=['GET'])
+def get_elasticities():
+    """Get the price elasticities currently used for markdown optimization"""
+    product_id = request.args.get('product_id')
+    category = request.args.get('category')
+    
+    if product_id or category:
+        data = {
+            'product_id': product_id,
+            'category': category,
+            'elasticity': markdown_optimizer.calculate_price_elasticity(category, product_id)
+        }
+    else:
+        sku_elasticities, category_elasticities = markdown_optimizer.get_elasticities()
+        data = {
+            'categories': category_elasticities or markdown_optimizer.price_elasticity_estimates,
+            'estimated_skus': len(sku_elasticities)
+        }
+    
+    return jsonify({
+        'success': True,
+        'data': data,
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/archive/compact', methods=['POST'])
+def compact_sales_archive():
+    """Start a background job that moves old sales history into the archive"""
+    try:
+        if data_loader.archive is None:
+            return jsonify({
+                'success': False,
+                'error': 'Sales archive is disabled (SALES_ARCHIVE_DIR is empty)',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            params = {
+                'retention_days': int(data.get('retention_days', SALES_RETENTION_DAYS)),
+                'rollup_days': int(data.get('rollup_days', SALES_ROLLUP_DAYS)),
+                'vacuum': bool(data.get('vacuum', False))
+            }
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            return jsonify({
+                'success': False,
+                'error': 'retention_days and rollup_days must be integers',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        if params['retention_days'] < 1 or params['rollup_days'] < params['retention_days']:
+            return jsonify({
+                'success': False,
+                'error': 'retention_days must be positive and no larger than rollup_days',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        job_id = job_manager.submit('sales_compaction', ['all'], params)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'job_id': job_id,
+                'status': 'pending',
+                'status_url': f'/jobs/{job_id}'
+            },
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error starting sales compaction: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/archive', methods=['GET'])
+def get_sales_archive():
+    """Get the archive boundary and the size of each archive tier"""
+    try:
+        if data_loader.archive is None:
+            return jsonify({
+                'success': False,
+                'error': 'Sales archive is disabled (SALES_ARCHIVE_DIR is empty)',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'data': dict(data_loader.archive.get_stats(), retention_days=SALES_RETENTION_DAYS,
+                         rollup_days=SALES_ROLLUP_DAYS),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error reading sales archive: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/sales', methods=['POST'])
+def ingest_sales():
+    """Accept a batch of POS sale events for micro-batched ingestion"""
+    try:
+        data = request.get_json(silent=True)
+        events = data.get('events') if isinstance(data, dict) else data
+        
+        if not isinstance(events, list) or not events:
+            return jsonify({
+                'success': False,
+                'error': 'Expected a non-empty list of events',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        try:
+            accepted = sales_ingestor.submit(events)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        # Callers that need read-your-writes can wait for the batch to commit
+        if isinstance(data, dict) and data.get('flush'):
+            sales_ingestor.flush()
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'accepted': accepted,
+                'ingestion': sales_ingestor.get_stats()
+            },
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error ingesting sales: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/recommendations/<product_id>', methods=['GET'])
+def get_recommendation(product_id):
+    """Get the cached forecast and markdown suggestions for a product, kept current by sales ingestion"""
+    try:
+        entry = recommendation_cache.get(product_id)
+        
+        if entry is None:
+            return jsonify({
+                'success': False,
+                'error': f'Product {product_id} not found',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'product_id': product_id,
+                'forecast': entry['forecast'],
+                'markdown': entry['markdown'],
+                'updated_at': entry['updated_at']
+            },
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching recommendations for product {product_id}: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/redistribution', methods=['GET'])
+@response_cache.cached
+def get_redistribution_plan():
+    """Get optimal stock transfers from stores with surplus to stores with unmet demand"""
+    try:
+        category = request.args.get('category')
+        product_id = request.args.get('product_id')
+        limit = request.args.get('limit', default=100, type=int)
+        
+        planner = redistribution_planner
+        if 'horizon_days' in request.args or 'max_distance_km' in request.args:
+            planner = RedistributionPlanner(
+                horizon_days=request.args.get('horizon_days', default=planner.horizon_days, type=int),
+                handling_cost=planner.handling_cost,
+                cost_per_km=planner.cost_per_km,
+                max_distance_km=request.args.get('max_distance_km', type=float)
+            )
+        
+        inventory_df = pd.DataFrame(data_loader.get_inventory(category=category,
+                                                              product_ids=[product_id] if product_id else None))
+        
+        if inventory_df.empty:
+            return jsonify({
+                'success': False,
+                'error': 'No inventory found for the given filters',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+        
+        demand_df = forecast_store_demand(inventory_df, planner.horizon_days)
+        plan = planner.plan(inventory_df, demand_df, data_loader.get_stores())
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'summary': plan['summary'],
+                'transfers': plan['transfers'].head(limit).to_dict('records')
+            },
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error planning redistribution: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
 @app.route('/analytics/summary', methods=['GET'])
+@response_cache.cached
 def get_analytics_summary():
     """Get analytics summary data"""
     try:
@@ -289,35 +910,34 @@ def get_analytics_summary():
         }), 500
 
 @app.route('/products/<product_id>/sales-history', methods=['GET'])
+@response_cache.cached
 def get_product_sales_history(product_id):
     """Get sales history for a specific product"""
     try:
         days = request.args.get('days', default=30, type=int)
-        sales_df = data_loader.get_sales_history(product_id, days=days)
+        history = data_loader.get_sales_history_array(product_id, days=days)
         
-        if sales_df.empty:
+        if len(history) == 0:
             return jsonify({
                 'success': False,
                 'error': f'No sales history found for product {product_id}',
                 'timestamp': datetime.now().isoformat()
             }), 404
         
-        # Format data for response
-        sales_data = []
-        for _, row in sales_df.iterrows():
-            sales_data.append({
-                'date': row['date'],
-                'units_sold': row['units_sold'],
-                'price': row['price']
-            })
+        # Format data for response straight from the array columns
+        sales_data = [
+            {'date': date, 'units_sold': units_sold, 'price': price}
+            for date, units_sold, price in zip(history['date'].tolist(), history['units_sold'].tolist(),
+                                               history['price'].tolist())
+        ]
         
         return jsonify({
             'success': True,
             'data': {
                 'product_id': product_id,
                 'sales_history': sales_data,
-                'total_units': sales_df['units_sold'].sum(),
-                'average_daily_sales': round(sales_df['units_sold'].mean(), 2),
+                'total_units': int(history['units_sold'].sum()),
+                'average_daily_sales': round(float(history['units_sold'].mean()), 2),
                 'days_covered': len(sales_data)
             },
             'timestamp': datetime.now().isoformat()
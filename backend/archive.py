@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Columnar archive tier for sales history.
+
+Sales older than the retention window move out of SQLite into Parquet files
+partitioned by month. Once they are older still, they are rolled up to weekly
+aggregates partitioned by year:
+
+    <archive_dir>/daily/month=2024-03/part-0.parquet
+    <archive_dir>/weekly/year=2022/part-0.parquet
+    <archive_dir>/manifest.json
+
+Examples:
+    python archive.py --db inventory.db --archive-dir data/archive --retention-days 120
+    python archive.py --db inventory.db --archive-dir data/archive --stats
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DAILY_SCHEMA = pa.schema([
+    ('date', pa.date32()),
+    ('product_id', pa.string()),
+    ('store_id', pa.string()),
+    ('units_sold', pa.int64()),
+    ('price', pa.float64())
+])
+
+WEEKLY_SCHEMA = pa.schema([
+    ('week_start', pa.date32()),
+    ('product_id', pa.string()),
+    ('store_id', pa.string()),
+    ('units_sold', pa.int64()),
+    ('price', pa.float64()),
+    ('days', pa.int64())
+])
+
+class SalesArchive:
+    """Month-partitioned Parquet archive of daily sales with a weekly rollup tier.
+
+    Each daily partition holds one row per (date, product, store), sorted by
+    product so row-group statistics prune product filters. The partition file
+    records the highest sales_history id it contains. Re-archiving after a
+    crash therefore never counts a row twice. The manifest records the date
+    before which rows live here and not in SQLite, so reads that combine both
+    tiers never overlap. Reads memory-map the files and return Arrow tables,
+    loading only the columns, partitions and row groups a query needs.
+    """
+
+    def __init__(self, archive_dir='data/archive', row_group_size=65536):
+        self.archive_dir = archive_dir
+        self.row_group_size = row_group_size
+        self.daily_dir = os.path.join(archive_dir, 'daily')
+        self.weekly_dir = os.path.join(archive_dir, 'weekly')
+        os.makedirs(self.daily_dir, exist_ok=True)
+        os.makedirs(self.weekly_dir, exist_ok=True)
+        # Read on every history query, so it is kept in memory and written through
+        self._manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        path = os.path.join(self.archive_dir, 'manifest.json')
+        if not os.path.exists(path):
+            return {'archived_before': None, 'rolled_before': None}
+        with open(path) as f:
+            return json.load(f)
+
+    def manifest(self):
+        return dict(self._manifest)
+
+    def _save_manifest(self, **changes):
+        manifest = dict(self._manifest, **changes, updated_at=datetime.now().isoformat())
+        fd, tmp_path = tempfile.mkstemp(dir=self.archive_dir, prefix='.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.archive_dir, 'manifest.json'))
+        self._manifest = manifest
+
+    @property
+    def archived_before(self):
+        """Rows dated before this ISO date are read from the archive, not SQLite"""
+        return self._manifest['archived_before']
+
+    def _partition_path(self, tier_dir, key, value):
+        return os.path.join(tier_dir, f'{key}={value}', 'part-0.parquet')
+
+    def _read_partition(self, path):
+        """Existing partition table and its metadata, or (None, {})"""
+        if not os.path.exists(path):
+            return None, {}
+        table = pq.read_table(path, memory_map=True)
+        metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+        return table.replace_schema_metadata(None), metadata
+
+    def _write_partition(self, path, table, metadata):
+        """Write a partition through a temp file and rename so readers never see a partial file"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = table.replace_schema_metadata({k: str(v) for k, v in metadata.items()})
+        # Dot-prefixed temp files are ignored by dataset discovery
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+        os.close(fd)
+        try:
+            pq.write_table(table, tmp_path, row_group_size=self.row_group_size, compression='zstd')
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def append_daily(self, month, sales_df):
+        """Merge sales_history rows (id, date, product_id, store_id, units_sold, price) of one month.
+
+        Rows at or below the partition's recorded id watermark are already
+        archived and skipped. Returns the number of rows merged.
+        """
+        path = self._partition_path(self.daily_dir, 'month', month)
+        existing, metadata = self._read_partition(path)
+        watermark = int(metadata.get('max_row_id', 0))
+        new_rows = sales_df[sales_df['id'] > watermark]
+        if new_rows.empty:
+            return 0
+
+        incoming = pa.Table.from_pandas(new_rows[['date', 'product_id', 'store_id', 'units_sold', 'price']],
+                                        preserve_index=False)
+        incoming = incoming.set_column(0, 'date', pc.cast(incoming['date'], pa.date32()))
+        incoming = incoming.cast(DAILY_SCHEMA)
+        table = incoming if existing is None else pa.concat_tables([existing, incoming])
+
+        # One row per (date, product, store): units add up, price is weighted by units sold
+        table = table.append_column('revenue', pc.multiply(table['price'], pc.cast(table['units_sold'], pa.float64())))
+        table = table.group_by(['date', 'product_id', 'store_id']).aggregate(
+            [('units_sold', 'sum'), ('revenue', 'sum'), ('price', 'mean')])
+        price = pc.if_else(pc.greater(table['units_sold_sum'], 0),
+                           pc.divide(table['revenue_sum'], pc.cast(table['units_sold_sum'], pa.float64())),
+                           table['price_mean'])
+        table = pa.table([table['date'], table['product_id'], table['store_id'], table['units_sold_sum'], price],
+                         schema=DAILY_SCHEMA)
+        table = table.sort_by([('product_id', 'ascending'), ('store_id', 'ascending'), ('date', 'ascending')])
+
+        self._write_partition(path, table, {'max_row_id': max(watermark, int(new_rows['id'].max()))})
+        return len(new_rows)
+
+    def set_archived_before(self, date):
+        current = self.archived_before
+        if current is None or date > current:
+            self._save_manifest(archived_before=date)
+
+    def daily_months(self):
+        return sorted(name.split('=', 1)[1] for name in os.listdir(self.daily_dir) if name.startswith('month='))
+
+    def rollup(self, before_month):
+        """Fold daily partitions for months before `before_month` (YYYY-MM) into weekly partitions"""
+        months = [month for month in self.daily_months() if month < before_month]
+        rolled = 0
+        for month in months:
+            daily, _ = self._read_partition(self._partition_path(self.daily_dir, 'month', month))
+            if daily is None:
+                continue
+            weekday = pc.day_of_week(daily['date'])  # Monday is 0
+            week_start = pc.cast(pc.subtract(pc.cast(daily['date'], pa.int32()), pc.cast(weekday, pa.int32())),
+                                 pa.date32())
+            revenue = pc.multiply(daily['price'], pc.cast(daily['units_sold'], pa.float64()))
+            weekly = pa.table({'week_start': week_start, 'product_id': daily['product_id'],
+                               'store_id': daily['store_id'], 'units_sold': daily['units_sold'],
+                               'revenue': revenue, 'days': np.ones(len(daily), dtype=np.int64)})
+
+            # A week can straddle two years; each row goes to the partition of its week's year
+            years = pc.year(weekly['week_start'])
+            for year in pc.unique(years).to_pylist():
+                self._merge_weekly(year, weekly.filter(pc.equal(years, year)), month)
+            rolled += len(daily)
+
+        if months:
+            self._save_manifest(rolled_before=max(before_month, self._manifest.get('rolled_before') or ''))
+            for month in months:
+                shutil.rmtree(os.path.join(self.daily_dir, f'month={month}'), ignore_errors=True)
+            logger.info(f"Rolled up {rolled} daily rows from {len(months)} month(s) to weekly aggregates")
+        return rolled
+
+    def _merge_weekly(self, year, rows, month):
+        path = self._partition_path(self.weekly_dir, 'year', year)
+        existing, metadata = self._read_partition(path)
+        months = metadata.get('months', '').split(',') if metadata.get('months') else []
+        # A partition that already lists the month was written before a crash interrupted the rollup
+        if month in months:
+            return
+
+        if existing is not None:
+            existing = existing.append_column(
+                'revenue', pc.multiply(existing['price'], pc.cast(existing['units_sold'], pa.float64())))
+            rows = pa.concat_tables([existing.select(rows.column_names), rows])
+        table = rows.group_by(['week_start', 'product_id', 'store_id']).aggregate(
+            [('units_sold', 'sum'), ('revenue', 'sum'), ('days', 'sum')])
+        units = pc.cast(table['units_sold_sum'], pa.float64())
+        price = pc.if_else(pc.greater(units, 0), pc.divide(table['revenue_sum'], units), 0.0)
+        table = pa.table([table['week_start'], table['product_id'], table['store_id'], table['units_sold_sum'],
+                          price, table['days_sum']], schema=WEEKLY_SCHEMA)
+        table = table.sort_by([('product_id', 'ascending'), ('store_id', 'ascending'), ('week_start', 'ascending')])
+        self._write_partition(path, table, {'months': ','.join(sorted(months + [month]))})
+
+    def _dataset(self, tier_dir, schema, partition_field):
+        return ds.dataset(tier_dir, schema=schema.append(pa.field(*partition_field)), format='parquet',
+                          filesystem=fs.LocalFileSystem(use_mmap=True),
+                          partitioning=ds.partitioning(pa.schema([partition_field]), flavor='hive'))
+
+    def read_daily(self, start=None, end=None, product_ids=None, columns=None):
+        """Archived daily rows with start <= date < end (ISO dates) as an Arrow table.
+
+        Only partitions for the requested months are opened, and row groups
+        are skipped using their product_id and date statistics.
+        """
+        dataset = self._dataset(self.daily_dir, DAILY_SCHEMA, ('month', pa.string()))
+        conditions = []
+        if start:
+            conditions.append((ds.field('month') >= start[:7]) & (ds.field('date') >= _date(start)))
+        if end:
+            conditions.append((ds.field('month') <= end[:7]) & (ds.field('date') < _date(end)))
+        rolled_before = self._manifest.get('rolled_before')
+        if rolled_before:
+            # Partitions left behind by an interrupted rollup are already in the weekly tier
+            conditions.append(ds.field('month') >= rolled_before)
+        if product_ids is not None:
+            conditions.append(ds.field('product_id').isin(list(product_ids)))
+        return self._scan(dataset, conditions, columns or DAILY_SCHEMA.names)
+
+    def daily_totals(self, start, end, product_ids=None, store_id=None):
+        """Archived units (summed) and price (averaged) per (product_id, date) as a DataFrame.
+
+        The layout matches DataLoader.get_all_sales_history, with ISO date strings.
+        """
+        table = self.read_daily(start, end, product_ids, columns=['product_id', 'store_id', 'date', 'units_sold', 'price'])
+        if store_id:
+            table = table.filter(pc.equal(table['store_id'], store_id))
+        table = table.group_by(['product_id', 'date']).aggregate([('units_sold', 'sum'), ('price', 'mean')])
+        table = pa.table({
+            'product_id': table['product_id'],
+            'date': pc.cast(table['date'], pa.string()),
+            'units_sold': table['units_sold_sum'],
+            'price': table['price_mean']
+        }).sort_by([('product_id', 'ascending'), ('date', 'ascending')])
+        # Arrow releases each column as it is converted, so the frame never exists twice in memory
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def read_weekly(self, start=None, end=None, product_ids=None, columns=None):
+        """Weekly rollup rows with start <= week_start < end (ISO dates) as an Arrow table"""
+        dataset = self._dataset(self.weekly_dir, WEEKLY_SCHEMA, ('year', pa.int32()))
+        conditions = []
+        if start:
+            conditions.append((ds.field('year') >= int(start[:4])) & (ds.field('week_start') >= _date(start)))
+        if end:
+            conditions.append((ds.field('year') <= int(end[:4])) & (ds.field('week_start') < _date(end)))
+        if product_ids is not None:
+            conditions.append(ds.field('product_id').isin(list(product_ids)))
+        return self._scan(dataset, conditions, columns or WEEKLY_SCHEMA.names)
+
+    def _scan(self, dataset, conditions, columns):
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return dataset.to_table(columns=columns, filter=expression)
+
+    def get_stats(self):
+        def tier(tier_dir):
+            rows = size = partitions = 0
+            for name in os.listdir(tier_dir):
+                path = os.path.join(tier_dir, name, 'part-0.parquet')
+                if os.path.exists(path):
+                    partitions += 1
+                    rows += pq.ParquetFile(path).metadata.num_rows
+                    size += os.path.getsize(path)
+            return {'partitions': partitions, 'rows': rows, 'bytes': size}
+
+        manifest = self.manifest()
+        return {
+            'archive_dir': self.archive_dir,
+            'archived_before': manifest['archived_before'],
+            'rolled_before': manifest.get('rolled_before'),
+            'daily': tier(self.daily_dir),
+            'weekly': tier(self.weekly_dir)
+        }
+
+def _date(iso_date):
+    return pa.scalar(datetime.strptime(iso_date, '%Y-%m-%d').date(), pa.date32())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old sales history from SQLite into the Parquet archive')
+    parser.add_argument('--db', default='inventory.db', help='SQLite database path')
+    parser.add_argument('--archive-dir', default='data/archive', help='Archive directory')
+    parser.add_argument('--retention-days', type=int, default=120, help='Days of sales kept in SQLite')
+    parser.add_argument('--rollup-days', type=int, default=730, help='Age after which daily rows become weekly')
+    parser.add_argument('--vacuum', action='store_true', help='Reclaim the freed space in the database file')
+    parser.add_argument('--stats', action='store_true', help='Only print archive statistics')
+    args = parser.parse_args(argv)
+
+    from data_loader import DataLoader
+    loader = DataLoader(args.db, archive=SalesArchive(args.archive_dir))
+    if not args.stats:
+        cutoff = (datetime.now() - timedelta(days=args.retention_days)).strftime('%Y-%m-%d')
+        rollup_month = (datetime.now() - timedelta(days=args.rollup_days)).strftime('%Y-%m')
+        result = loader.archive_sales(cutoff, rollup_month, vacuum=args.vacuum)
+        logger.info(f"Archived {result['archived_rows']} rows dated before {cutoff}")
+    print(json.dumps(loader.archive.get_stats(), indent=2))
+
+if __name__ == '__main__':
+    main()
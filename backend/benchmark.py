@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the backend hot paths.
+
+Micro-benchmarks time DataLoader queries, feature preparation, forecasting
+and markdown optimization directly; macro-benchmarks drive the Flask
+endpoints through the test client. Each dataset scale runs in its own
+process against a freshly generated database, and results are saved as JSON
+so runs can be compared.
+
+Examples:
+    python benchmark.py --scales small,medium --output bench.json
+    python benchmark.py --scales small --output new.json --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# name: (skus, days, stores)
+SCALES = {
+    'small': (100, 90, 1),
+    'medium': (1000, 365, 1),
+    'large': (5000, 730, 1),
+}
+
+def measure(fn, repeat=20, warmup=2):
+    """Time fn() and return latency statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    samples.sort()
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0], 4),
+        'median_ms': round(statistics.median(samples), 4),
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        'max_ms': round(samples[-1], 4)
+    }
+
+def compare_models(data_loader, workdir, max_skus=200, holdout=7, history_days=90):
+    """Backtest per-SKU and global models on the last `holdout` days of up to max_skus products"""
+    import numpy as np
+    import pandas as pd
+    from forecast import DemandForecaster
+
+    # Windows longer than the retention period are read from the sales archive
+    history = data_loader.get_all_sales_history(days=history_days)
+    categories = data_loader.get_product_categories()
+    product_ids = list(dict.fromkeys(history['product_id']))[:max_skus]
+    history = history[history['product_id'].isin(product_ids)]
+
+    cutoff = pd.to_datetime(history['date']).max() - pd.Timedelta(days=holdout)
+    is_train = pd.to_datetime(history['date']) <= cutoff
+    train, test = history[is_train], history[~is_train]
+    train_by_sku = {pid: df.reset_index(drop=True) for pid, df in train.groupby('product_id', sort=False)}
+    actual_by_sku = {pid: df['units_sold'].values for pid, df in test.groupby('product_id', sort=False)}
+
+    results = {}
+    for model_type in DemandForecaster.MODEL_TYPES:
+        forecaster = DemandForecaster(os.path.join(workdir, f'compare-{model_type}'), model_type=model_type)
+
+        t0 = time.perf_counter()
+        if model_type == 'per_sku':
+            for pid, df in train_by_sku.items():
+                forecaster.train_model(pid, df)
+        else:
+            forecaster.fit_pooled(train, categories)
+        fit_seconds = time.perf_counter() - t0
+
+        errors, pct_errors = [], []
+        t0 = time.perf_counter()
+        for pid, df in train_by_sku.items():
+            predicted = np.array([f['predicted'] for f in forecaster.forecast(pid, df, days=holdout)])
+            actual = actual_by_sku.get(pid, np.array([]))[:len(predicted)]
+            errors.append(np.abs(actual - predicted[:len(actual)]))
+            nonzero = actual > 0
+            pct_errors.append(np.abs(actual[nonzero] - predicted[:len(actual)][nonzero]) / actual[nonzero])
+        forecast_seconds = time.perf_counter() - t0
+
+        results[model_type] = {
+            'skus': len(train_by_sku),
+            'fit_seconds': round(fit_seconds, 3),
+            'forecast_ms_per_sku': round(forecast_seconds * 1000 / max(1, len(train_by_sku)), 3),
+            'mae': round(float(np.concatenate(errors).mean()), 3),
+            'mape': round(float(np.concatenate(pct_errors).mean() * 100), 2),
+            'models_in_memory': len(forecaster.models) if model_type == 'per_sku' else 1
+        }
+    return results
+
+def pick_markdown_product(optimizer, inventory, forecast_for, start=0, attempts=50):
+    """First unexpired lot from `start` whose stock outlasts its forecast, so optimize_markdown runs the discount search"""
+    candidates = inventory[start:] + inventory[:start]
+    for item in [item for item in candidates if item['days_until_expiry'] > 0 and item['stock'] > 0][:attempts]:
+        forecast_data = forecast_for(item['product_id'])
+        predicted = sum(f['predicted'] for f in forecast_data[:item['days_until_expiry']])
+        if optimizer.calculate_waste_reduction(item['stock'], predicted, item['days_until_expiry']) > 0:
+            return item, forecast_data
+    return None, None
+
+def run_scale(scale, repeat):
+    """Generate a dataset for one scale and run every benchmark against it"""
+    skus, days, stores = SCALES[scale]
+    workdir = tempfile.mkdtemp(prefix=f'bench-{scale}-')
+    db_path = os.path.join(workdir, 'inventory.db')
+
+    # Configure the app before importing it
+    os.environ['INVENTORY_DB'] = db_path
+    os.environ['MODEL_CACHE_DIR'] = os.path.join(workdir, 'models')
+    os.environ['SEED_SAMPLE_DATA'] = 'false'
+    os.environ['SALES_ARCHIVE_DIR'] = os.path.join(workdir, 'archive')
+    os.environ['SALES_COMPACT_ON_START'] = 'false'
+    os.environ['MARKDOWN_BATCH_SYNC_LIMIT'] = '1000000'
+    # Endpoints would otherwise be timed as response cache hits after the first call
+    os.environ['RESPONSE_CACHE_ENTRIES'] = '0'
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    from generate_data import generate_dataset, write_db
+    t0 = time.perf_counter()
+    write_db(generate_dataset(skus, days, stores, seed=42), db_path)
+    generate_seconds = time.perf_counter() - t0
+
+    from app import (app, data_loader, forecaster, markdown_optimizer, compact_sales_history,
+                     change_feed, job_manager, sales_ingestor)
+    from forecast import DemandForecaster
+
+    # Archive old history up front so queries run against the hot table a live server keeps
+    t0 = time.perf_counter()
+    archived = compact_sales_history({}, ['all'])[0]
+    archive_seconds = time.perf_counter() - t0
+
+    inventory = data_loader.get_inventory()
+    product_ids = [item['product_id'] for item in inventory]
+    product_id = product_ids[len(product_ids) // 2]
+    sales_df = data_loader.get_sales_history(product_id, days=90)
+    forecast_data = forecaster.forecast(product_id, sales_df, days=7)
+    forecast_for = lambda pid: forecaster.forecast(pid, data_loader.get_sales_history(pid, days=90), days=7)
+    product, markdown_forecast = pick_markdown_product(markdown_optimizer, inventory, forecast_for, start=len(inventory) // 2)
+    if product is None:
+        product = next(item for item in inventory if item['product_id'] == product_id)
+        markdown_forecast = forecast_data
+    batch_ids = product_ids[:50]
+    batch_products = [item for item in inventory if item['product_id'] in set(batch_ids)]
+    batch_forecasts = {pid: forecast_data for pid in batch_ids}
+
+    cold_dir = os.path.join(workdir, 'cold-models')
+
+    def cold_forecast():
+        DemandForecaster(cold_dir).forecast(product_id, sales_df, days=7)
+        for name in os.listdir(cold_dir):
+            os.remove(os.path.join(cold_dir, name))
+
+    micro = {
+        'get_inventory': measure(lambda: data_loader.get_inventory(), repeat),
+        'get_inventory_expiring': measure(lambda: data_loader.get_inventory(expiry_days=3), repeat),
+        'get_sales_history': measure(lambda: data_loader.get_sales_history(product_id, days=90), repeat),
+        'get_sales_history_365': measure(lambda: data_loader.get_sales_history(product_id, days=365), repeat),
+        'get_sales_history_array': measure(lambda: data_loader.get_sales_history_array(product_id, days=90), repeat),
+        'get_inventory_records_one': measure(lambda: data_loader.get_inventory_records(product_ids=[product_id]), repeat),
+        'prepare_features': measure(lambda: forecaster.prepare_features(sales_df.copy()), repeat),
+        'forecast_cold': measure(cold_forecast, repeat),
+        'forecast_warm': measure(lambda: forecaster.forecast(product_id, sales_df, days=7), repeat),
+        'optimize_markdown': measure(lambda: markdown_optimizer.optimize_markdown(product, markdown_forecast), repeat),
+        'optimize_markdown_scenario': measure(
+            lambda: markdown_optimizer.optimize_markdown(product, markdown_forecast, mode='scenario'), repeat),
+        'batch_optimize_50': measure(lambda: markdown_optimizer.batch_optimize(batch_products, batch_forecasts), repeat),
+    }
+
+    client = app.test_client()
+
+    def get(path):
+        def call():
+            response = client.get(path)
+            assert response.status_code == 200, f'{path} returned {response.status_code}'
+        return call
+
+    def post(path, body):
+        def call():
+            response = client.post(path, json=body)
+            assert response.status_code == 200, f'{path} returned {response.status_code}'
+        return call
+
+    macro = {
+        'GET /inventory': measure(get('/inventory'), repeat),
+        'GET /analytics/summary': measure(get('/analytics/summary'), repeat),
+        'GET /forecast/<id>': measure(get(f'/forecast/{product_id}'), repeat),
+        'GET /markdown/<id>': measure(get(f"/markdown/{product['product_id']}?store_id={product['store_id']}"), repeat),
+        'GET /products/<id>/sales-history': measure(get(f'/products/{product_id}/sales-history?days=90'), repeat),
+        'POST /markdown/batch (10)': measure(post('/markdown/batch', {'product_ids': product_ids[:10]}), max(3, repeat // 4)),
+    }
+
+    models = compare_models(data_loader, workdir)
+
+    # Background threads would otherwise recreate an empty database while it is removed
+    for component in (sales_ingestor, job_manager, change_feed):
+        component.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'dataset': {'skus': skus, 'days': days, 'stores': stores,
+                    'sales_rows': skus * days * stores, 'generate_seconds': round(generate_seconds, 2),
+                    'hot_sales_rows': archived['hot_rows'], 'archive_seconds': round(archive_seconds, 2)},
+        'micro': micro,
+        'macro': macro,
+        'models': models
+    }
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def compare(current, baseline, threshold):
+    """Print median latency changes against a baseline run; returns the number of regressions"""
+    regressions = 0
+    for scale, result in current['results'].items():
+        base = baseline.get('results', {}).get(scale)
+        if not base:
+            continue
+        print(f'\n[{scale}]')
+        for group in ('micro', 'macro'):
+            for name, stats in result[group].items():
+                old = base.get(group, {}).get(name)
+                if not old:
+                    continue
+                ratio = stats['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+                flag = ''
+                if ratio > 1 + threshold:
+                    flag = '  REGRESSION'
+                    regressions += 1
+                elif ratio < 1 - threshold:
+                    flag = '  faster'
+                print(f"  {name:<36} {old['median_ms']:>10.3f} -> {stats['median_ms']:>10.3f} ms  ({ratio:5.2f}x){flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the backend hot paths')
+    parser.add_argument('--scales', default='small,medium', help=f"Comma-separated scales from {', '.join(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per benchmark')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write JSON results')
+    parser.add_argument('--compare', help='Baseline JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative median change reported as a regression')
+    parser.add_argument('--scale-worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.scale_worker:
+        # Child process: run one scale and print its results as JSON
+        print(json.dumps(run_scale(args.scale_worker, args.repeat)))
+        return 0
+
+    results = {}
+    for scale in args.scales.split(','):
+        if scale not in SCALES:
+            parser.error(f'Unknown scale: {scale}')
+        print(f'Running {scale} benchmarks {SCALES[scale]}...', file=sys.stderr)
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--scale-worker', scale, '--repeat', str(args.repeat)],
+            cwd=os.path.dirname(os.path.abspath(__file__)), text=True)
+        results[scale] = json.loads(output.strip().splitlines()[-1])
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+    for scale, result in results.items():
+        print(f'\n[{scale}] {result["dataset"]}')
+        for group in ('micro', 'macro'):
+            for name, stats in result[group].items():
+                print(f"  {name:<36} median {stats['median_ms']:>10.3f} ms   p95 {stats['p95_ms']:>10.3f} ms")
+        for model_type, stats in result.get('models', {}).items():
+            print(f"  model {model_type:<30} fit {stats['fit_seconds']:>7.3f} s   "
+                  f"forecast {stats['forecast_ms_per_sku']:>7.3f} ms/sku   MAE {stats['mae']:>7.3f}   MAPE {stats['mape']:>6.2f}%")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(report, baseline, args.threshold) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
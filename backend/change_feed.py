@@ -0,0 +1,190 @@
+import json
+import queue
+import sqlite3
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class ChangeFeed:
+    """Fan-out of data change events to server-sent-event subscribers.
+
+    Every published event gets an increasing id and is kept in a bounded
+    history. A client reconnecting with Last-Event-ID gets the events it
+    missed replayed. If they are no longer held it gets a 'reset' event, so
+    it refetches one snapshot. Subscribers whose queue fills up (slow
+    clients) are dropped, and they recover the same way on reconnect.
+
+    With a db_path, events go through a change_events table instead of
+    process memory. Every process polls the table every poll_interval
+    seconds, so subscribers connected to any worker see writes made by all
+    of them, and event ids are shared across workers and restarts. Without
+    one, the feed is local to the process.
+    """
+
+    def __init__(self, history_size=1000, queue_size=500, db_path=None, poll_interval=0.25,
+                 retention_minutes=10):
+        self.history = deque(maxlen=history_size)
+        self.queue_size = queue_size
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.retention_minutes = retention_minutes
+        self.subscribers = set()
+        self.last_id = 0
+        self.published = 0
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poller = None
+        if db_path:
+            self._init_table()
+
+    def _init_table(self):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS change_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            # Start from the newest events so reconnecting clients can replay across restarts
+            rows = conn.execute('SELECT id, event_type, payload FROM change_events ORDER BY id DESC LIMIT ?',
+                                (self.history.maxlen,)).fetchall()
+        conn.close()
+        self.history.extend(reversed(rows))
+        if rows:
+            self.last_id = rows[0][0]
+
+    def start(self):
+        """Start polling the shared change table; a no-op for an in-process feed"""
+        if not self.db_path or (self._poller is not None and self._poller.is_alive()):
+            return
+        self._stop.clear()
+        self._poller = threading.Thread(target=self._run, name='change-feed-poller', daemon=True)
+        self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+        self._poller = None
+
+    def _run(self):
+        polls = 0
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+                polls += 1
+                if polls % 240 == 0:
+                    self._prune()
+            except Exception as e:
+                logger.error(f"Change feed poll failed: {e}")
+
+    def publish(self, event_type, data):
+        """Record an event and queue it for every subscriber"""
+        payload = json.dumps(data, default=str)
+        self.published += 1
+        if not self.db_path:
+            with self._lock:
+                self._deliver([(self.last_id + 1, event_type, payload)])
+            return
+
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute('INSERT INTO change_events (event_type, payload) VALUES (?, ?)', (event_type, payload))
+        conn.close()
+        # Deliver to this process's subscribers now rather than on the next poll
+        self.poll()
+
+    def poll(self):
+        """Deliver events other processes (or this one) wrote to the change table since the last poll"""
+        with self._poll_lock:
+            conn = sqlite3.connect(self.db_path)
+            rows = conn.execute('SELECT id, event_type, payload FROM change_events WHERE id > ? ORDER BY id',
+                                (self.last_id,)).fetchall()
+            conn.close()
+            if rows:
+                with self._lock:
+                    self._deliver(rows)
+
+    def _prune(self):
+        # Keep the replay window, plus anything recent enough that a slow poller may not have read it
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute('''
+                DELETE FROM change_events WHERE id <= ? AND created_at < datetime('now', ?)
+            ''', (self.last_id - self.history.maxlen, f'-{self.retention_minutes} minutes'))
+        conn.close()
+
+    def _deliver(self, events):
+        """Append events to the history and queue them for every subscriber; caller holds the lock"""
+        dropped = []
+        for event in events:
+            self.last_id = event[0]
+            self.history.append(event)
+            for subscriber in self.subscribers:
+                if subscriber in dropped:
+                    continue
+                if subscriber.qsize() >= self.queue_size:
+                    dropped.append(subscriber)
+                else:
+                    subscriber.put_nowait(event)
+        for subscriber in dropped:
+            self.subscribers.discard(subscriber)
+            subscriber.put_nowait(None)
+        if dropped:
+            logger.warning(f"Dropped {len(dropped)} slow change feed subscriber(s)")
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber queue, pre-filled with any events missed since last_event_id"""
+        # One spare slot so a full queue can still receive the closing sentinel
+        subscriber = queue.Queue(maxsize=self.queue_size + 1)
+        with self._lock:
+            if last_event_id is not None and last_event_id != self.last_id:
+                missed = [event for event in self.history if event[0] > last_event_id]
+                # In-process ids restart with the server, and history is bounded; either way the client must resync
+                if not missed or missed[0][0] != last_event_id + 1 or len(missed) > self.queue_size:
+                    missed = [(self.last_id, 'reset', json.dumps({'reason': 'missed events'}))]
+                for event in missed:
+                    subscriber.put_nowait(event)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self.subscribers.discard(subscriber)
+
+    def stream(self, subscriber, status_callback, heartbeat=15.0, event_types=None):
+        """Yield SSE frames for a subscriber, with a 'status' event on connect and every heartbeat seconds"""
+        def frame(event_id, event_type, payload):
+            prefix = f'id: {event_id}\n' if event_id is not None else ''
+            return f'{prefix}event: {event_type}\ndata: {payload}\n\n'
+
+        try:
+            yield 'retry: 3000\n\n'
+            yield frame(None, 'status', json.dumps(status_callback()))
+            while True:
+                try:
+                    event = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield frame(None, 'status', json.dumps(status_callback()))
+                    continue
+                if event is None:
+                    return
+                event_id, event_type, payload = event
+                if event_types is None or event_type in event_types or event_type == 'reset':
+                    yield frame(event_id, event_type, payload)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def get_stats(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'published': self.published,
+            'last_event_id': self.last_id,
+            'shared': bool(self.db_path)
+        }
@@ -1,17 +1,105 @@
 import pandas as pd
+import numpy as np
 import sqlite3
 import os
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone
 import logging
+from metrics import timed
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rows written without a store belong to the default store
+DEFAULT_STORE_ID = 'STORE001'
+
+INVENTORY_FIELDS = ('product_id', 'product_name', 'category', 'current_price', 'inventory_id', 'store_id',
+                    'stock', 'expiry_date', 'status', 'days_until_expiry')
+
+# Daily sales history as returned by get_sales_history_array
+SALES_HISTORY_DTYPE = np.dtype([('date', 'U10'), ('units_sold', 'i8'), ('price', 'f8')])
+
+class InventoryRecord:
+    """One inventory lot joined with its product, built directly from a cursor row.
+    
+    Supports item access and get() so code written against get_inventory()
+    dicts accepts records unchanged.
+    """
+    __slots__ = INVENTORY_FIELDS
+    
+    def __init__(self, product_id, product_name, category, current_price, inventory_id, store_id,
+                 stock, expiry_date, status, days_until_expiry):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.category = category
+        self.current_price = current_price
+        self.inventory_id = inventory_id
+        self.store_id = store_id
+        self.stock = stock
+        self.expiry_date = expiry_date
+        self.status = status
+        self.days_until_expiry = days_until_expiry
+        
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+        
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+        
+    def to_dict(self):
+        return {field: getattr(self, field) for field in INVENTORY_FIELDS}
+
 class DataLoader:
-    def __init__(self, db_path='inventory.db'):
+    def __init__(self, db_path='inventory.db', archive=None):
         self.db_path = db_path
+        # Optional SalesArchive holding sales_history rows older than the retention window
+        self.archive = archive
+        self.change_listeners = []
+        self._local = threading.local()
         self.init_database()
         
+    def _bump_version(self, conn):
+        """Advance the data version inside the caller's write transaction"""
+        conn.execute('''
+            INSERT INTO metadata (key, value) VALUES ('data_version', '1')
+            ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1, updated_at = CURRENT_TIMESTAMP
+        ''')
+        
+    @property
+    def data_version(self):
+        """Counter advanced by every write, shared by all processes using the database.
+        
+        Caches compare it on every request, so each thread keeps one read connection
+        instead of opening a new one per call.
+        """
+        return self._metadata_int('data_version')
+        
+    @property
+    def elasticity_version(self):
+        """Data version of the last elasticity save, so every process can tell when its estimates are stale"""
+        return self._metadata_int('elasticity_version')
+        
+    def _metadata_int(self, key):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path)
+        row = conn.execute('SELECT value FROM metadata WHERE key = ?', (key,)).fetchone()
+        return int(row[0]) if row else 0
+        
+    def add_change_listener(self, listener):
+        """Register listener(change_type, data), called after writes commit"""
+        self.change_listeners.append(listener)
+        
+    def _notify(self, change_type, data):
+        for listener in self.change_listeners:
+            try:
+                listener(change_type, data)
+            except Exception as e:
+                logger.error(f"Change listener failed for {change_type}: {e}")
+        
     def init_database(self):
         """Initialize SQLite database with required tables"""
         conn = sqlite3.connect(self.db_path)
@@ -28,11 +116,23 @@ class DataLoader:
             )
         ''')
         
+        # Create stores table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stores (
+                store_id TEXT PRIMARY KEY,
+                store_name TEXT NOT NULL,
+                latitude REAL,
+                longitude REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
         # Create inventory table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS inventory (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 product_id TEXT NOT NULL,
+                store_id TEXT NOT NULL DEFAULT 'STORE001',
                 stock INTEGER NOT NULL,
                 expiry_date DATE NOT NULL,
                 status TEXT DEFAULT 'safe',
@@ -47,6 +147,7 @@ class DataLoader:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 date DATE NOT NULL,
                 product_id TEXT NOT NULL,
+                store_id TEXT NOT NULL DEFAULT 'STORE001',
                 units_sold INTEGER NOT NULL,
                 price REAL NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -59,6 +160,7 @@ class DataLoader:
             CREATE TABLE IF NOT EXISTS markdown_suggestions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 product_id TEXT NOT NULL,
+                store_id TEXT NOT NULL DEFAULT 'STORE001',
                 suggested_discount REAL NOT NULL,
                 potential_savings REAL NOT NULL,
                 confidence_score REAL NOT NULL,
@@ -67,6 +169,84 @@ class DataLoader:
             )
         ''')
         
+        # Create jobs tables for background batch processing
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                params TEXT NOT NULL,
+                items TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                processed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                owner TEXT,
+                lease_until REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                item_offset INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (job_id, item_offset),
+                FOREIGN KEY (job_id) REFERENCES jobs (job_id)
+            )
+        ''')
+        
+        # Create price_elasticities table (scope is 'sku' or 'category')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_elasticities (
+                scope TEXT NOT NULL,
+                key TEXT NOT NULL,
+                elasticity REAL NOT NULL,
+                n_observations INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (scope, key)
+            )
+        ''')
+        
+        # Key/value settings such as the sample-data seed marker
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Databases created before the store dimension get a store_id column on the default store
+        for table in ('inventory', 'sales_history', 'markdown_suggestions'):
+            columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+            if 'store_id' not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN store_id TEXT NOT NULL DEFAULT '{DEFAULT_STORE_ID}'")
+                logger.info(f"Added store_id column to {table}")
+        
+        # Jobs claimed by one of several worker processes carry an owner and a lease (unix time)
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(jobs)')]
+        for column, column_type in (('owner', 'TEXT'), ('lease_until', 'REAL')):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+                logger.info(f"Added {column} column to jobs")
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_inventory_store ON inventory (store_id, product_id)')
+        
+        # Only the latest suggestion per product and store is kept; older databases appended every one
+        has_lot_index = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_suggestions_lot'").fetchone()
+        if not has_lot_index:
+            cursor.execute('''
+                DELETE FROM markdown_suggestions WHERE id NOT IN (
+                    SELECT MAX(id) FROM markdown_suggestions GROUP BY product_id, store_id
+                )
+            ''')
+            cursor.execute('CREATE UNIQUE INDEX idx_suggestions_lot ON markdown_suggestions (product_id, store_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_product_date ON sales_history (product_id, date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_date ON sales_history (date)')
+        
         conn.commit()
         conn.close()
         logger.info("Database initialized successfully")
@@ -89,6 +269,13 @@ class DataLoader:
         except Exception as e:
             logger.error(f"Error loading CSV data: {e}")
             
+    @staticmethod
+    def _lot_status(days_until_expiry, stock, predicted_demand):
+        """Inventory status from shelf life and stock against the demand expected before expiry; works on arrays"""
+        return np.where(days_until_expiry < 0, 'expired',
+               np.where(days_until_expiry <= 2, 'expiring',
+               np.where(stock > predicted_demand * 1.5, 'overstock', 'safe')))
+        
     def _load_inventory_from_df(self, df):
         """Load inventory data from DataFrame"""
         conn = sqlite3.connect(self.db_path)
@@ -103,45 +290,83 @@ class DataLoader:
             # Calculate status based on expiry date
             expiry_date = pd.to_datetime(row['expiryDate'])
             days_until_expiry = (expiry_date - pd.Timestamp.now()).days
-            
-            if days_until_expiry < 0:
-                status = 'expired'
-            elif days_until_expiry <= 2:
-                status = 'expiring'
-            elif row['stock'] > row.get('predictedDemand', 0) * 1.5:
-                status = 'overstock'
-            else:
-                status = 'safe'
+            status = str(self._lot_status(days_until_expiry, row['stock'], row.get('predictedDemand', 0)))
             
             # Insert inventory
             conn.execute('''
-                INSERT OR REPLACE INTO inventory (product_id, stock, expiry_date, status)
-                VALUES (?, ?, ?, ?)
-            ''', (row['productId'], row['stock'], row['expiryDate'], status))
+                INSERT OR REPLACE INTO inventory (product_id, store_id, stock, expiry_date, status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (row['productId'], row.get('storeId', DEFAULT_STORE_ID), row['stock'], row['expiryDate'], status))
         
+        self._bump_version(conn)
         conn.commit()
         conn.close()
+        self._notify('reset', {'reason': 'inventory reloaded', 'rows': len(df)})
         
     def _load_sales_from_df(self, df):
         """Load sales data from DataFrame"""
+        sales = pd.DataFrame({
+            'date': df['date'],
+            'product_id': df['productId'],
+            'store_id': df['storeId'] if 'storeId' in df else DEFAULT_STORE_ID,
+            'units_sold': df['unitsSold'],
+            'price': df['price'] if 'price' in df else 5.99
+        })
+        self.bulk_load(sales_df=sales)
+        
+    def bulk_load(self, products_df=None, inventory_df=None, sales_df=None, stores_df=None):
+        """Bulk insert snake_case DataFrames in a single transaction"""
         conn = sqlite3.connect(self.db_path)
         
-        for _, row in df.iterrows():
-            conn.execute('''
-                INSERT OR REPLACE INTO sales_history (date, product_id, units_sold, price)
-                VALUES (?, ?, ?, ?)
-            ''', (row['date'], row['productId'], row['unitsSold'], row.get('price', 5.99)))
+        with conn:
+            if stores_df is not None and not stores_df.empty:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO stores (store_id, store_name, latitude, longitude)
+                    VALUES (?, ?, ?, ?)
+                ''', self._rows(stores_df, ['store_id', 'store_name', 'latitude', 'longitude']))
+                
+            if products_df is not None and not products_df.empty:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO products (product_id, product_name, category, current_price)
+                    VALUES (?, ?, ?, ?)
+                ''', self._rows(products_df, ['product_id', 'product_name', 'category', 'current_price']))
+                
+            if inventory_df is not None and not inventory_df.empty:
+                conn.executemany('''
+                    INSERT INTO inventory (product_id, store_id, stock, expiry_date, status)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', self._rows(self._with_store(inventory_df),
+                                ['product_id', 'store_id', 'stock', 'expiry_date', 'status']))
+                
+            if sales_df is not None and not sales_df.empty:
+                conn.executemany('''
+                    INSERT INTO sales_history (date, product_id, store_id, units_sold, price)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', self._rows(self._with_store(sales_df),
+                                ['date', 'product_id', 'store_id', 'units_sold', 'price']))
+            self._bump_version(conn)
         
-        conn.commit()
         conn.close()
+        # Bulk loads are too large to diff; clients resync from a fresh snapshot
+        if any(df is not None and not df.empty for df in (products_df, inventory_df, stores_df)):
+            self._notify('reset', {'reason': 'bulk load'})
         
-    def get_inventory(self, category=None, expiry_days=None):
-        """Get inventory data with optional filters"""
+    def _with_store(self, df):
+        """Assign rows without a store_id column to the default store"""
+        return df if 'store_id' in df else df.assign(store_id=DEFAULT_STORE_ID)
+        
+    def _rows(self, df, columns):
+        """Iterate DataFrame rows as plain Python tuples for executemany"""
+        # tolist() converts NumPy scalars to Python types sqlite3 can bind
+        return zip(*(df[col].tolist() for col in columns))
+        
+    def _inventory_rows(self, category=None, expiry_days=None, store_id=None, product_ids=None):
+        """Inventory rows as tuples in INVENTORY_FIELDS order, earliest expiry first"""
         conn = sqlite3.connect(self.db_path)
         
         query = '''
             SELECT p.product_id, p.product_name, p.category, p.current_price,
-                   i.stock, i.expiry_date, i.status,
+                   i.id AS inventory_id, i.store_id, i.stock, i.expiry_date, i.status,
                    CAST(julianday(i.expiry_date) - julianday('now') AS INTEGER) as days_until_expiry
             FROM products p
             JOIN inventory i ON p.product_id = i.product_id
@@ -158,32 +383,364 @@ class DataLoader:
             conditions.append("CAST(julianday(i.expiry_date) - julianday('now') AS INTEGER) <= ?")
             params.append(expiry_days)
             
+        if store_id:
+            conditions.append("i.store_id = ?")
+            params.append(store_id)
+            
+        if product_ids is not None:
+            conditions.append("p.product_id IN ({})".format(','.join('?' * len(product_ids))))
+            params.extend(product_ids)
+            
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
             
         query += " ORDER BY i.expiry_date ASC"
         
-        df = pd.read_sql_query(query, conn, params=params)
+        rows = conn.execute(query, params).fetchall()
         conn.close()
         
-        return df.to_dict('records')
+        return rows
+        
+    @timed('get_inventory')
+    def get_inventory(self, category=None, expiry_days=None, store_id=None, product_ids=None):
+        """Get inventory data with optional filters"""
+        return [dict(zip(INVENTORY_FIELDS, row))
+                for row in self._inventory_rows(category, expiry_days, store_id, product_ids)]
+        
+    @timed('get_inventory_records')
+    def get_inventory_records(self, category=None, expiry_days=None, store_id=None, product_ids=None):
+        """Get inventory as InventoryRecord objects, for per-request lookups that need no dicts"""
+        return [InventoryRecord(*row) for row in self._inventory_rows(category, expiry_days, store_id, product_ids)]
         
-    def get_sales_history(self, product_id, days=90):
-        """Get sales history for a product"""
+    @timed('get_sales_history')
+    def get_sales_history(self, product_id, days=90, store_id=None):
+        """Get sales history for a product, summed across stores unless store_id is given"""
+        return pd.DataFrame(self.get_sales_history_array(product_id, days, store_id))
+        
+    @timed('get_sales_history_array')
+    def get_sales_history_array(self, product_id, days=90, store_id=None):
+        """Get sales history for a product as a SALES_HISTORY_DTYPE structured array ordered by date"""
         conn = sqlite3.connect(self.db_path)
         
         query = '''
-            SELECT date, units_sold, price
+            SELECT date, SUM(units_sold) AS units_sold, AVG(price) AS price
             FROM sales_history
             WHERE product_id = ? AND date >= date('now', '-{} days')
-            ORDER BY date ASC
-        '''.format(days)
+        '''.format(int(days))
+        params = [product_id]
+        
+        if store_id:
+            query += " AND store_id = ?"
+            params.append(store_id)
+            
+        archived_before, archived = self._archived_history(days, [product_id], store_id)
+        if archived_before:
+            query += " AND date >= ?"
+            params.append(archived_before)
+            
+        query += " GROUP BY date ORDER BY date ASC"
+        
+        history = np.fromiter(conn.execute(query, params), dtype=SALES_HISTORY_DTYPE)
+        conn.close()
+        
+        if archived is not None and not archived.empty:
+            history = np.concatenate([
+                np.fromiter(zip(archived['date'], archived['units_sold'], archived['price']), dtype=SALES_HISTORY_DTYPE),
+                history
+            ])
+        return history
+        
+    @timed('get_all_sales_history')
+    def get_all_sales_history(self, days=90, product_ids=None):
+        """Get sales history for every product (summed across stores), ordered by product and date"""
+        conn = sqlite3.connect(self.db_path)
+        
+        query = '''
+            SELECT product_id, date, SUM(units_sold) AS units_sold, AVG(price) AS price
+            FROM sales_history
+            WHERE date >= date('now', '-{} days')
+        '''.format(int(days))
+        params = []
+        
+        if product_ids is not None:
+            query += " AND product_id IN ({})".format(','.join('?' * len(product_ids)))
+            params.extend(product_ids)
+            
+        archived_before, archived = self._archived_history(days, product_ids)
+        if archived_before:
+            query += " AND date >= ?"
+            params.append(archived_before)
+            
+        query += " GROUP BY product_id, date ORDER BY product_id ASC, date ASC"
+        
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        
+        if archived is not None and not archived.empty:
+            df = pd.concat([archived, df], ignore_index=True).sort_values(
+                ['product_id', 'date'], kind='stable', ignore_index=True)
+        return df
+        
+    def _archived_history(self, days, product_ids=None, store_id=None):
+        """Archive boundary and archived daily sales in the last `days` days per (product_id, date).
+        
+        Rows dated before the boundary are read only from the archive and the
+        rest only from SQLite, so callers add `date >= boundary` to their query.
+        The boundary is None when nothing is archived. The frame is None when
+        the window does not reach back to the boundary.
+        """
+        archived_before = self.archive.archived_before if self.archive is not None else None
+        if archived_before is None:
+            return None, None
+        # date('now') in SQLite is UTC
+        start = (datetime.now(timezone.utc) - timedelta(days=int(days))).strftime('%Y-%m-%d')
+        if start >= archived_before:
+            return archived_before, None
+        return archived_before, self.archive.daily_totals(start, archived_before, product_ids, store_id)
+        
+    @timed('record_sales')
+    def record_sales(self, sales_df):
+        """Insert sales rows and take the units out of stock in one transaction.
+        
+        sales_df has date, product_id, store_id, units_sold and price. Stock is
+        drawn from each store's earliest-expiring lots first, and each drawn
+        lot's status is recomputed against the store's last 7 days of sales.
+        Returns the data version this write produced.
+        """
+        conn = sqlite3.connect(self.db_path)
+        
+        with conn:
+            conn.executemany('''
+                INSERT INTO sales_history (date, product_id, store_id, units_sold, price)
+                VALUES (?, ?, ?, ?, ?)
+            ''', self._rows(sales_df, ['date', 'product_id', 'store_id', 'units_sold', 'price']))
+            
+            sold = sales_df.groupby(['product_id', 'store_id'], as_index=False)['units_sold'].sum()
+            product_ids = sold['product_id'].unique().tolist()
+            lots = pd.read_sql_query('''
+                SELECT id, product_id, store_id, stock,
+                       CAST(julianday(expiry_date) - julianday('now') AS INTEGER) AS days_until_expiry
+                FROM inventory
+                WHERE stock > 0 AND product_id IN ({})
+                ORDER BY product_id, store_id, expiry_date ASC, id ASC
+            '''.format(','.join('?' * len(product_ids))), conn, params=product_ids)
+            
+            lots = lots.merge(sold, on=['product_id', 'store_id'])
+            if not lots.empty:
+                drawn_before = lots.groupby(['product_id', 'store_id'])['stock'].cumsum() - lots['stock']
+                take = (lots['units_sold'] - drawn_before).clip(lower=0, upper=lots['stock'])
+                lots = lots.assign(stock=lots['stock'] - take)[take > 0]
+                
+                # Expected demand before expiry, as loaded: recent daily sales times the days left
+                recent = pd.read_sql_query('''
+                    SELECT product_id, store_id, SUM(units_sold) / 7.0 AS daily_demand
+                    FROM sales_history
+                    WHERE date >= date('now', '-7 days') AND product_id IN ({})
+                    GROUP BY product_id, store_id
+                '''.format(','.join('?' * len(product_ids))), conn, params=product_ids)
+                lots = lots.merge(recent, on=['product_id', 'store_id'], how='left')
+                predicted = lots['daily_demand'].fillna(0) * lots['days_until_expiry'].clip(lower=1)
+                lots['status'] = self._lot_status(lots['days_until_expiry'], lots['stock'], predicted)
+                conn.executemany('''
+                    UPDATE inventory SET stock = ?, status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+                ''', self._rows(lots, ['stock', 'status', 'id']))
+            self._bump_version(conn)
+            version = int(conn.execute("SELECT value FROM metadata WHERE key = 'data_version'").fetchone()[0])
+        
+        conn.close()
+        if not lots.empty:
+            self._notify('inventory', [
+                {'inventoryId': lot_id, 'productId': product_id, 'storeId': store_id, 'stock': stock, 'status': status}
+                for lot_id, product_id, store_id, stock, status
+                in self._rows(lots, ['id', 'product_id', 'store_id', 'stock', 'status'])
+            ])
+        return version
+        
+    @timed('archive_sales')
+    def archive_sales(self, before_date, rollup_before_month=None, vacuum=False):
+        """Move sales_history rows dated before `before_date` into the archive.
+        
+        Rows are copied month by month, then the archive boundary is advanced,
+        and only then are the rows deleted. A crash at any point leaves each row
+        readable from exactly one tier, and rerunning finishes the move. Rows
+        inserted while this runs stay in SQLite until the next run. Archived
+        months before `rollup_before_month` (YYYY-MM) are rolled up to weekly
+        aggregates.
+        """
+        if self.archive is None:
+            raise ValueError('No sales archive configured')
+        
+        conn = sqlite3.connect(self.db_path)
+        max_id = conn.execute('SELECT MAX(id) FROM sales_history WHERE date < ?', (before_date,)).fetchone()[0]
+        archived = deleted = 0
+        
+        if max_id is not None:
+            months = [row[0] for row in conn.execute('''
+                SELECT DISTINCT substr(date, 1, 7) FROM sales_history WHERE date < ? ORDER BY 1
+            ''', (before_date,))]
+            for month in months:
+                rows = pd.read_sql_query('''
+                    SELECT id, date, product_id, store_id, units_sold, price
+                    FROM sales_history
+                    WHERE date >= ? AND date < ? AND id <= ?
+                ''', conn, params=(f'{month}-01', min(before_date, self._next_month(month)), max_id))
+                archived += self.archive.append_daily(month, rows)
+            
+            self.archive.set_archived_before(before_date)
+            with conn:
+                deleted = conn.execute('DELETE FROM sales_history WHERE date < ? AND id <= ?',
+                                       (before_date, max_id)).rowcount
+            if vacuum:
+                conn.execute('VACUUM')
+        
+        hot_rows = conn.execute('SELECT COUNT(*) FROM sales_history').fetchone()[0]
+        conn.close()
+        
+        rolled = self.archive.rollup(rollup_before_month) if rollup_before_month else 0
+        if rolled:
+            # Moving rows leaves reads unchanged, but rolled-up months drop out of daily history
+            conn = sqlite3.connect(self.db_path)
+            with conn:
+                self._bump_version(conn)
+            conn.close()
+        logger.info(f"Archived {archived} sales rows before {before_date}, deleted {deleted}, {hot_rows} left in SQLite")
+        return {
+            'archived_before': self.archive.archived_before,
+            'archived_rows': archived,
+            'deleted_rows': deleted,
+            'rolled_up_rows': rolled,
+            'hot_rows': hot_rows
+        }
+        
+    @staticmethod
+    def _next_month(month):
+        year, month = map(int, month.split('-'))
+        return f'{year + month // 12:04d}-{month % 12 + 1:02d}-01'
+        
+    def save_markdown_suggestions(self, suggestions):
+        """Store the latest markdown suggestion for each (product_id, store_id); returns the new data version"""
+        conn = sqlite3.connect(self.db_path)
+        
+        with conn:
+            conn.executemany('''
+                INSERT INTO markdown_suggestions
+                    (product_id, store_id, suggested_discount, potential_savings, confidence_score)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (product_id, store_id) DO UPDATE SET
+                    suggested_discount = excluded.suggested_discount,
+                    potential_savings = excluded.potential_savings,
+                    confidence_score = excluded.confidence_score,
+                    created_at = CURRENT_TIMESTAMP
+            ''', [(s['product_id'], s.get('store_id') or DEFAULT_STORE_ID, s['optimal_discount'],
+                   s.get('potential_savings', 0), s['confidence_score'])
+                  for s in suggestions])
+            self._bump_version(conn)
+            version = int(conn.execute("SELECT value FROM metadata WHERE key = 'data_version'").fetchone()[0])
         
-        df = pd.read_sql_query(query, conn, params=[product_id])
         conn.close()
+        self._notify('markdown', suggestions)
+        return version
         
+    def get_store_shares(self, product_ids, days=28):
+        """Each store's share of a product's units sold over the last `days` days as {product_id: {store_id: share}}.
+        
+        Products with no sales in the window are left out.
+        """
+        if not product_ids:
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('''
+            SELECT product_id, store_id, SUM(units_sold)
+            FROM sales_history
+            WHERE date >= date('now', ?) AND product_id IN ({})
+            GROUP BY product_id, store_id
+        '''.format(','.join('?' * len(product_ids))), [f'-{int(days)} days', *product_ids]).fetchall()
+        conn.close()
+        
+        totals = {}
+        for product_id, _, units in rows:
+            totals[product_id] = totals.get(product_id, 0) + units
+        shares = {}
+        for product_id, store_id, units in rows:
+            if totals[product_id] > 0:
+                shares.setdefault(product_id, {})[store_id] = units / totals[product_id]
+        return shares
+        
+    @timed('get_store_demand')
+    def get_store_demand(self, days=28, product_ids=None):
+        """Get mean daily units sold per store and product over the last `days` days"""
+        conn = sqlite3.connect(self.db_path)
+        
+        query = '''
+            SELECT store_id, product_id, SUM(units_sold) * 1.0 / {days} AS daily_demand
+            FROM sales_history
+            WHERE date >= date('now', '-{days} days')
+        '''.format(days=int(days))
+        params = []
+        if product_ids is not None:
+            query += " AND product_id IN ({})".format(','.join('?' * len(product_ids)))
+            params.extend(product_ids)
+        query += " GROUP BY store_id, product_id"
+        
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        
+        return df
+        
+    def get_stores(self):
+        """Get all stores with their coordinates"""
+        conn = sqlite3.connect(self.db_path)
+        df = pd.read_sql_query('SELECT store_id, store_name, latitude, longitude FROM stores ORDER BY store_id', conn)
+        conn.close()
         return df
         
+    def get_product_categories(self, product_ids=None):
+        """Get a mapping of product_id to category"""
+        conn = sqlite3.connect(self.db_path)
+        query = 'SELECT product_id, category FROM products'
+        params = []
+        if product_ids is not None:
+            query += " WHERE product_id IN ({})".format(','.join('?' * len(product_ids)))
+            params.extend(product_ids)
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+        return dict(rows)
+        
+    def save_elasticities(self, sku_estimates, category_estimates):
+        """Replace stored elasticity estimates; returns their elasticity_version"""
+        conn = sqlite3.connect(self.db_path)
+        
+        with conn:
+            conn.execute('DELETE FROM price_elasticities')
+            conn.executemany('''
+                INSERT INTO price_elasticities (scope, key, elasticity, n_observations)
+                VALUES ('category', ?, ?, ?)
+            ''', [(c, e['elasticity'], e['n_observations']) for c, e in category_estimates.items()])
+            conn.executemany('''
+                INSERT INTO price_elasticities (scope, key, elasticity, n_observations)
+                VALUES ('sku', ?, ?, ?)
+            ''', self._rows(sku_estimates, ['product_id', 'elasticity', 'n_observations']))
+            self._bump_version(conn)
+            version = conn.execute("SELECT value FROM metadata WHERE key = 'data_version'").fetchone()[0]
+            conn.execute('''
+                INSERT INTO metadata (key, value) VALUES ('elasticity_version', ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+            ''', (version,))
+        
+        conn.close()
+        return int(version)
+        
+    def get_elasticities(self):
+        """Get stored elasticities as ({product_id: value}, {category: value})"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('SELECT scope, key, elasticity FROM price_elasticities').fetchall()
+        conn.close()
+        
+        sku, category = {}, {}
+        for scope, key, elasticity in rows:
+            (sku if scope == 'sku' else category)[key] = elasticity
+        return sku, category
+        
     def seed_sample_data(self):
         """Create sample data for testing"""
         sample_products = [
@@ -204,26 +761,44 @@ class DataLoader:
             ('PROD006', 34, '2025-01-20', 'safe')
         ]
         
-        # Generate sample sales history
+        # Generate sample sales history (seeded so runs are reproducible)
         sample_sales = []
         base_date = datetime.now() - timedelta(days=90)
+        rng = np.random.default_rng(42)
         
         for product_id, _, _, price in sample_products:
+            noise = rng.integers(-5, 5, size=90)
             for i in range(90):
                 date = base_date + timedelta(days=i)
                 # Simulate varying sales with some randomness
                 base_sales = 15 + (i % 7) * 2  # Weekly pattern
-                units_sold = max(0, base_sales + (hash(f"{product_id}{i}") % 10 - 5))
+                units_sold = max(0, base_sales + int(noise[i]))
                 sample_sales.append((date.strftime('%Y-%m-%d'), product_id, units_sold, price))
         
         conn = sqlite3.connect(self.db_path)
-        
-        # Insert sample data
-        conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)', sample_products)
-        conn.executemany('INSERT OR REPLACE INTO inventory (product_id, stock, expiry_date, status) VALUES (?, ?, ?, ?)', sample_inventory)
-        conn.executemany('INSERT OR REPLACE INTO sales_history (date, product_id, units_sold, price) VALUES (?, ?, ?, ?)', sample_sales)
-        
-        conn.commit()
+        sample_ids = [p[0] for p in sample_products]
+        with conn:
+            # Seed once per database. Databases seeded before the marker existed already hold the
+            # sample products, so they are only marked as seeded
+            # Claiming the marker is the first write, so concurrent boots cannot both seed
+            claimed = conn.execute("INSERT OR IGNORE INTO metadata (key, value) VALUES ('sample_data_seeded', ?)",
+                                   (datetime.now().isoformat(),)).rowcount
+            present = conn.execute(f"SELECT 1 FROM products WHERE product_id IN ({','.join('?' * len(sample_ids))})",
+                                   sample_ids).fetchone()
+            seed = bool(claimed) and not present
+            if seed:
+                conn.execute('INSERT OR IGNORE INTO stores (store_id, store_name, latitude, longitude) '
+                             'VALUES (?, ?, ?, ?)', (DEFAULT_STORE_ID, 'Bentonville Supercenter', 36.3729, -94.2088))
+                conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)',
+                                 sample_products)
+                conn.executemany('INSERT INTO inventory (product_id, stock, expiry_date, status) VALUES (?, ?, ?, ?)',
+                                 sample_inventory)
+                conn.executemany('INSERT INTO sales_history (date, product_id, units_sold, price) VALUES (?, ?, ?, ?)',
+                                 sample_sales)
+                self._bump_version(conn)
         conn.close()
         
+        if not seed:
+            logger.info("Sample data already seeded")
+            return
         logger.info("Sample data seeded successfully")
\ No newline at end of file
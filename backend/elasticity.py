@@ -0,0 +1,81 @@
+import pandas as pd
+import numpy as np
+import logging
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+class ElasticityEstimator:
+    """Batched log-log price elasticity estimates for every SKU.
+
+    All regressions are computed together from per-SKU sums (np.bincount),
+    so there is no per-SKU loop. Each SKU slope is shrunk toward its
+    category's pooled within-SKU slope, weighted by how much its price varied.
+    SKUs and categories without price variation keep the prior.
+    """
+
+    def __init__(self, priors=None, shrinkage=0.5, bounds=(-5.0, -0.1)):
+        self.priors = priors or {}
+        # Price variation (sum of squared log-price deviations) worth as much as the category estimate
+        self.shrinkage = shrinkage
+        self.bounds = bounds
+
+    def _prior(self, category):
+        return self.priors.get(category, self.priors.get('default', -1.3))
+
+    @timed('estimate_elasticities')
+    def estimate(self, history_df, product_categories):
+        """Estimate elasticities from product_id, price, units_sold history.
+
+        Returns (sku_estimates DataFrame, category_estimates dict).
+        """
+        df = history_df[(history_df['price'] > 0) & history_df['units_sold'].notna()]
+        if df.empty:
+            return pd.DataFrame(columns=['product_id', 'category', 'elasticity', 'n_observations']), {}
+
+        codes, product_ids = pd.factorize(df['product_id'])
+        n_skus = len(product_ids)
+        x = np.log(df['price'].to_numpy(dtype=float))
+        y = np.log1p(df['units_sold'].to_numpy(dtype=float))
+
+        # Per-SKU sufficient statistics for a regression with a SKU intercept
+        n = np.bincount(codes, minlength=n_skus).astype(float)
+        sx = np.bincount(codes, weights=x, minlength=n_skus)
+        sy = np.bincount(codes, weights=y, minlength=n_skus)
+        sxx = np.bincount(codes, weights=x * x, minlength=n_skus) - sx * sx / n
+        sxy = np.bincount(codes, weights=x * y, minlength=n_skus) - sx * sy / n
+        sxx = np.maximum(sxx, 0.0)
+
+        has_variation = sxx > 1e-9
+        sku_slope = np.divide(sxy, sxx, out=np.full(n_skus, np.nan), where=has_variation)
+
+        # Category slope pools the within-SKU variation of all its SKUs
+        categories = pd.Series(product_ids).map(product_categories).fillna('default').to_numpy()
+        cat_codes, cat_names = pd.factorize(categories)
+        cat_sxx = np.bincount(cat_codes, weights=sxx, minlength=len(cat_names))
+        cat_sxy = np.bincount(cat_codes, weights=sxy, minlength=len(cat_names))
+        cat_prior = np.array([self._prior(c) for c in cat_names])
+        cat_slope = cat_prior.copy()
+        cat_varied = cat_sxx > 1e-9
+        cat_slope[cat_varied] = cat_sxy[cat_varied] / cat_sxx[cat_varied]
+        cat_slope = np.clip(cat_slope, *self.bounds)
+
+        weight = sxx / (sxx + self.shrinkage)
+        shrunk = np.where(has_variation, weight * sku_slope + (1 - weight) * cat_slope[cat_codes], cat_slope[cat_codes])
+        elasticity = np.clip(shrunk, *self.bounds)
+
+        sku_estimates = pd.DataFrame({
+            'product_id': product_ids,
+            'category': categories,
+            'elasticity': np.round(elasticity, 4),
+            'n_observations': n.astype(int),
+            'weight': np.round(weight, 4)
+        })
+        category_estimates = {
+            c: {'elasticity': round(float(slope), 4), 'n_observations': int(count)}
+            for c, slope, count in zip(cat_names, cat_slope, np.bincount(cat_codes, weights=n, minlength=len(cat_names)))
+        }
+
+        logger.info(f"Estimated elasticities for {n_skus} SKUs in {len(cat_names)} categories "
+                    f"({int(has_variation.sum())} with price variation)")
+        return sku_estimates, category_estimates
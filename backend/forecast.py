@@ -6,16 +6,32 @@ from datetime import datetime, timedelta
 import logging
 import joblib
 import os
+import tempfile
+from single_flight import SingleFlight
+from global_forecast import GlobalForecaster
+from holt_winters import HoltWintersEngine
+from metrics import timed, stage_latency, model_cache, model_trainings
 
 logger = logging.getLogger(__name__)
 
 class DemandForecaster:
-    def __init__(self, cache_dir='models'):
+    MODEL_TYPES = ('per_sku', 'global', 'holt_winters')
+    
+    def __init__(self, cache_dir='models', model_type='per_sku'):
+        if model_type not in self.MODEL_TYPES:
+            raise ValueError(f"Unknown model type: {model_type}")
         self.cache_dir = cache_dir
+        self.model_type = model_type
         self.models = {}
         self.scalers = {}
+        self.global_model = GlobalForecaster()
+        self.holt_winters = HoltWintersEngine()
+        self.rows_since_fit = 0
+        self._training_flight = SingleFlight()
+        self._forecast_flight = SingleFlight()
         os.makedirs(cache_dir, exist_ok=True)
         
+    @timed('prepare_features')
     def prepare_features(self, sales_df):
         """Prepare features for forecasting model"""
         if sales_df.empty:
@@ -42,6 +58,7 @@ class DemandForecaster:
         
         return sales_df
         
+    @timed('train_model')
     def train_model(self, product_id, sales_df):
         """Train forecasting model for a specific product"""
         try:
@@ -69,17 +86,18 @@ class DemandForecaster:
             # Train model
             model = LinearRegression()
             model.fit(X_scaled, y)
+            model_trainings.inc()
             
-            # Cache model and scaler
-            self.models[product_id] = model
+            # Cache model and scaler (scaler first, load_model checks models)
             self.scalers[product_id] = scaler
+            self.models[product_id] = model
             
             # Save to disk
             model_path = os.path.join(self.cache_dir, f'model_{product_id}.joblib')
             scaler_path = os.path.join(self.cache_dir, f'scaler_{product_id}.joblib')
             
-            joblib.dump(model, model_path)
-            joblib.dump(scaler, scaler_path)
+            self._atomic_dump(scaler, scaler_path)
+            self._atomic_dump(model, model_path)
             
             logger.info(f"Model trained and cached for product {product_id}")
             return model
@@ -92,6 +110,7 @@ class DemandForecaster:
         """Load cached model for a product"""
         try:
             if product_id in self.models:
+                model_cache.inc(result='memory')
                 return self.models[product_id], self.scalers[product_id]
                 
             model_path = os.path.join(self.cache_dir, f'model_{product_id}.joblib')
@@ -101,28 +120,128 @@ class DemandForecaster:
                 model = joblib.load(model_path)
                 scaler = joblib.load(scaler_path)
                 
-                self.models[product_id] = model
                 self.scalers[product_id] = scaler
+                self.models[product_id] = model
                 
+                model_cache.inc(result='disk')
                 return model, scaler
                 
         except Exception as e:
             logger.error(f"Error loading model for product {product_id}: {e}")
             
+        model_cache.inc(result='miss')
         return None, None
         
-    def forecast(self, product_id, sales_df, days=7):
-        """Generate forecast for a product"""
+    def _atomic_dump(self, obj, path):
+        """Write obj to path via a temp file and rename so readers never see a partial file"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
         try:
-            # Try to load existing model
-            model, scaler = self.load_model(product_id)
+            with os.fdopen(fd, 'wb') as f:
+                joblib.dump(obj, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+            
+    def _load_or_train(self, product_id, sales_df):
+        """Load the cached model or train one, once per product across concurrent callers"""
+        model, scaler = self.load_model(product_id)
+        if model is not None:
+            return model, scaler
             
-            # If no model exists, train one
+        def train():
+            # Another caller may have finished training while we waited for the lock
+            model, scaler = self.load_model(product_id)
             if model is None:
                 model = self.train_model(product_id, sales_df)
-                if model is None:
-                    return self._fallback_forecast(sales_df, days)
-                scaler = self.scalers[product_id]
+                scaler = self.scalers.get(product_id) if model is not None else None
+            return model, scaler
+            
+        return self._training_flight.do(product_id, train)
+        
+    def get_stats(self):
+        """Get counters for cached models and coalesced requests"""
+        training = self._training_flight.get_stats()
+        forecasts = self._forecast_flight.get_stats()
+        return {
+            'cached_models': len(self.models),
+            'trainings_coalesced': training['coalesced'],
+            'forecasts_coalesced': forecasts['coalesced'],
+            'coalesced_requests': training['coalesced'] + forecasts['coalesced']
+        }
+        
+    def fit_pooled(self, history_df, product_categories, through=None):
+        """Fit the catalog-wide model selected by model_type on all SKUs' history.
+        
+        Holt-Winters only fits days up to `through`; later days are applied as they complete.
+        """
+        if self.model_type == 'global':
+            return self.fit_global(history_df, product_categories)
+        if self.model_type == 'holt_winters':
+            self.holt_winters.fit(history_df, through=through)
+            model_trainings.inc()
+            return self.holt_winters
+        return None
+        
+    @staticmethod
+    def split_by_store(forecast, shares, store_ids):
+        """Scale a product-level forecast to each store by its share of the product's recent sales.
+        
+        Returns {store_id: forecast}. Stores that have not sold the product get zero
+        demand; if no store has, demand is split evenly across store_ids.
+        """
+        store_ids = list(dict.fromkeys(store_ids))
+        if not shares:
+            shares = {store_id: 1.0 / len(store_ids) for store_id in store_ids}
+        return {
+            store_id: [
+                dict(day, **{field: round(day[field] * shares.get(store_id, 0.0), 1)
+                             for field in ('predicted', 'confidence_lower', 'confidence_upper')})
+                for day in forecast or []
+            ]
+            for store_id in store_ids
+        }
+        
+    def on_sales_committed(self, sales_df, data_version=None):
+        """Ingestion listener: advance Holt-Winters state with the committed sales"""
+        if self.model_type == 'holt_winters' and self.holt_winters.is_fitted:
+            self.holt_winters.add_sales(sales_df)
+        elif self.model_type == 'global':
+            # The global model is refitted, not updated; count what it has not seen yet
+            self.rows_since_fit += len(sales_df)
+        
+    def fit_global(self, history_df, product_categories):
+        """Fit the pooled model on all SKUs' history (used when model_type is 'global')"""
+        # Fit a fresh model and swap it in, so forecasts running during a refit see a consistent one
+        global_model = GlobalForecaster(alpha=self.global_model.alpha, prior_days=self.global_model.prior_days)
+        model = global_model.fit(history_df, product_categories)
+        if model is not None:
+            self.global_model = global_model
+            model_trainings.inc()
+        return model
+        
+    def forecast(self, product_id, sales_df, days=7, category=None):
+        """Generate forecast for a product"""
+        # Concurrent requests for the same product and history share one computation
+        last_date = sales_df['date'].iloc[-1] if not sales_df.empty else None
+        key = (product_id, days, len(sales_df), str(last_date))
+        return self._forecast_flight.do(key, lambda: self._forecast(product_id, sales_df, days, category))
+        
+    def _forecast(self, product_id, sales_df, days=7, category=None):
+        try:
+            if self.model_type == 'global' and self.global_model.is_fitted:
+                with stage_latency.time(stage='predict'):
+                    return self.global_model.forecast(product_id, sales_df, days, category)
+                    
+            if self.model_type == 'holt_winters':
+                with stage_latency.time(stage='predict'):
+                    forecasts = self.holt_winters.forecast(product_id, sales_df, days)
+                return forecasts if forecasts is not None else self._fallback_forecast(sales_df, days)
+            
+            model, scaler = self._load_or_train(product_id, sales_df)
+            if model is None:
+                return self._fallback_forecast(sales_df, days)
             
             # Prepare recent data for forecasting
             df = self.prepare_features(sales_df.copy())
@@ -160,7 +279,8 @@ class DemandForecaster:
                 X_scaled = scaler.transform(X)
                 
                 # Make prediction
-                prediction = model.predict(X_scaled)[0]
+                with stage_latency.time(stage='predict'):
+                    prediction = model.predict(X_scaled)[0]
                 prediction = max(0, prediction)  # Ensure non-negative
                 
                 # Calculate confidence interval (simple approach)
@@ -181,6 +301,91 @@ class DemandForecaster:
             logger.error(f"Error generating forecast for product {product_id}: {e}")
             return self._fallback_forecast(sales_df, days)
             
+    @timed('forecast_demand')
+    def forecast_demand(self, history_df, days=7, product_categories=None):
+        """Mean daily demand over the next `days` for every product in history_df.
+        
+        history_df has product_id, date and units_sold rows ordered by product and
+        date, as from DataLoader.get_all_sales_history. Every model type covers the
+        whole catalog in one vectorized pass instead of one forecast() per product;
+        products the model cannot cover get the moving-average fallback. Returns a
+        Series indexed by product_id.
+        """
+        if history_df.empty:
+            return pd.Series(dtype=float)
+        if self.model_type == 'global' and self.global_model.is_fitted:
+            predicted, product_ids = self.global_model.forecast_many(history_df, days, product_categories)
+            demand = pd.Series(np.round(predicted, 1).mean(axis=1), index=product_ids)
+        elif self.model_type == 'holt_winters':
+            demand = self.holt_winters.forecast_mean(history_df, days)
+        else:
+            demand = self._per_sku_demand(history_df, days)
+            
+        missing = history_df[~history_df['product_id'].isin(demand.index)]
+        if not missing.empty:
+            demand = pd.concat([demand, self._fallback_demand(missing, days)])
+        return demand
+        
+    def _per_sku_demand(self, history_df, days):
+        """Evaluate every product's own model at once from its stacked scaler and regression coefficients"""
+        groups = history_df.groupby('product_id', sort=False)
+        counts = groups.size()
+        product_ids, models, scalers = [], [], []
+        # Forecasting reads the last 7 days for the weekly lag, so shorter histories use the fallback
+        for product_id in counts.index[counts >= 7]:
+            if product_id in self.models:
+                model, scaler = self.models[product_id], self.scalers[product_id]
+            else:
+                model, scaler = self._load_or_train(product_id, groups.get_group(product_id).reset_index(drop=True))
+            if model is not None:
+                product_ids.append(product_id)
+                models.append(model)
+                scalers.append(scaler)
+        if not product_ids:
+            return pd.Series(dtype=float)
+            
+        mean = np.array([scaler.mean_ for scaler in scalers])
+        scale = np.array([scaler.scale_ for scaler in scalers])
+        coef = np.array([model.coef_ for model in models])
+        intercept = np.array([model.intercept_ for model in models])
+        
+        # The last-row features prepare_features would give each product
+        df = history_df.loc[history_df['product_id'].isin(product_ids), ['product_id', 'date', 'units_sold']].copy()
+        df['date'] = pd.to_datetime(df['date'])
+        grouped = df.groupby('product_id', sort=False)
+        first_date = grouped['date'].first().reindex(product_ids)
+        last_date = grouped['date'].last().reindex(product_ids)
+        last_units = grouped['units_sold'].last().reindex(product_ids).to_numpy(dtype=float)
+        days_since_start = (last_date - first_date).dt.days.to_numpy()
+        tail7 = grouped.tail(7)
+        ma7 = tail7.groupby('product_id', sort=False)['units_sold'].mean().reindex(product_ids).to_numpy()
+        ma14 = grouped.tail(14).groupby('product_id', sort=False)['units_sold'].mean().reindex(product_ids).to_numpy()
+        # Column j holds the units sold 7 - j days before the forecast start
+        week = np.empty((len(product_ids), 7))
+        week[pd.Index(product_ids).get_indexer(tail7['product_id']),
+             6 - tail7.groupby('product_id', sort=False).cumcount(ascending=False).to_numpy()] = tail7['units_sold']
+        
+        predicted = np.empty((len(product_ids), days))
+        for i in range(days):
+            forecast_date = last_date + timedelta(days=i + 1)
+            X = np.column_stack([
+                forecast_date.dt.dayofweek, forecast_date.dt.day, forecast_date.dt.month, days_since_start + i + 1,
+                last_units if i == 0 else predicted[:, i - 1],
+                week[:, i] if i < 7 else predicted[:, i - 7],
+                ma7, ma14
+            ])
+            with stage_latency.time(stage='predict'):
+                raw = np.einsum('ij,ij->i', (X - mean) / scale, coef) + intercept
+            predicted[:, i] = np.round(np.maximum(0, raw), 1)
+        return pd.Series(predicted.mean(axis=1), index=product_ids)
+        
+    def _fallback_demand(self, history_df, days):
+        """Mean daily demand from the moving average and weekly factors of _fallback_forecast"""
+        recent = history_df.groupby('product_id', sort=False).tail(14)
+        recent_avg = recent.groupby('product_id', sort=False)['units_sold'].mean()
+        weekdays = pd.date_range(datetime.now() + timedelta(days=1), periods=days, freq='D').weekday
+        return recent_avg * np.where(np.isin(weekdays, [4, 5, 6]), 1.2, 0.9).mean()
+        
     def _fallback_forecast(self, sales_df, days=7):
         """Simple fallback forecast using moving average"""
         if sales_df.empty:
@@ -234,15 +439,24 @@ class DemandForecaster:
             train_df = sales_df.iloc[:-test_days]
             test_df = sales_df.iloc[-test_days:]
             
+            # History can skip days, so forecast through the last test date and compare date by date
+            test_dates = pd.to_datetime(test_df['date'])
+            horizon = int((test_dates.iloc[-1] - pd.to_datetime(train_df['date'].iloc[-1])).days)
+            
             # Generate forecast on training data
-            forecasts = self.forecast(product_id, train_df, test_days)
+            if self.model_type == 'holt_winters':
+                # The stored state has already seen the test days, so refit on the training rows alone
+                forecasts = self.holt_winters.forecast_series(train_df, horizon)
+            else:
+                forecasts = self.forecast(product_id, train_df, horizon)
             
             if not forecasts:
                 return None
                 
             # Calculate accuracy metrics
+            predicted_by_date = {f['date']: f['predicted'] for f in forecasts}
             actual_values = test_df['units_sold'].values
-            predicted_values = [f['predicted'] for f in forecasts]
+            predicted_values = [predicted_by_date[d] for d in test_dates.dt.strftime('%Y-%m-%d')]
             
             mae = np.mean(np.abs(np.array(actual_values) - np.array(predicted_values)))
             mape = np.mean(np.abs((np.array(actual_values) - np.array(predicted_values)) / np.array(actual_values))) * 100
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic dataset generator for load and scale testing.
+
+Generates products, inventory and daily sales with weekly and yearly
+seasonality, promotions and category-specific shelf lives. All randomness
+comes from a seeded NumPy generator, so the same arguments always produce
+the same data.
+
+Examples:
+    python generate_data.py --skus 1000 --days 365 --output db --path bench.db
+    python generate_data.py --skus 100000 --days 730 --stores 3 --output parquet --path data/synthetic
+    python generate_data.py --skus 1000 --days 90 --shards shard0,shard1 --path data/shards --replace
+"""
+import argparse
+import os
+import sqlite3
+import time
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from data_loader import DataLoader
+from sharding import HashRing
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Category profiles: price range, mean daily units, shelf life in days, weekly shape (Mon..Sun)
+CATEGORIES = {
+    'Produce': {'price': (0.99, 5.99), 'demand': 25, 'shelf_life': (3, 8),
+                'weekly': (0.9, 0.85, 0.9, 0.95, 1.1, 1.25, 1.05)},
+    'Dairy': {'price': (1.99, 7.99), 'demand': 18, 'shelf_life': (7, 21),
+              'weekly': (0.95, 0.9, 0.95, 1.0, 1.05, 1.15, 1.0)},
+    'Deli': {'price': (3.99, 12.99), 'demand': 10, 'shelf_life': (2, 6),
+             'weekly': (0.85, 0.85, 0.9, 1.0, 1.2, 1.3, 0.9)},
+    'Bakery': {'price': (1.49, 6.99), 'demand': 14, 'shelf_life': (2, 5),
+               'weekly': (0.9, 0.9, 0.9, 0.95, 1.1, 1.3, 0.95)},
+    'Meat': {'price': (4.99, 19.99), 'demand': 8, 'shelf_life': (3, 7),
+             'weekly': (0.85, 0.85, 0.9, 0.95, 1.15, 1.3, 1.0)},
+    'Seafood': {'price': (6.99, 24.99), 'demand': 5, 'shelf_life': (2, 4),
+                'weekly': (0.8, 0.85, 0.9, 1.0, 1.3, 1.25, 0.9)},
+}
+
+# Price elasticity used to turn promotion discounts into demand uplift
+ELASTICITY = {'Produce': -1.5, 'Dairy': -1.2, 'Deli': -1.8, 'Bakery': -1.4, 'Meat': -1.6, 'Seafood': -1.7}
+
+def generate_chunk(rng, start_index, n_skus, days, n_stores, end_date):
+    """Generate products, inventory and sales for SKUs [start_index, start_index + n_skus)"""
+    categories = np.array(list(CATEGORIES))
+    cat_idx = rng.integers(0, len(categories), size=n_skus)
+    cat_names = categories[cat_idx]
+
+    price_lo = np.array([CATEGORIES[c]['price'][0] for c in categories])[cat_idx]
+    price_hi = np.array([CATEGORIES[c]['price'][1] for c in categories])[cat_idx]
+    base_price = np.round(rng.uniform(price_lo, price_hi), 2)
+
+    product_ids = np.array([f'SKU{i:07d}' for i in range(start_index, start_index + n_skus)])
+    products = pd.DataFrame({
+        'product_id': product_ids,
+        'product_name': [f'{c} Item {i}' for c, i in zip(cat_names, range(start_index, start_index + n_skus))],
+        'category': cat_names,
+        'current_price': base_price
+    })
+
+    # One series per (sku, store); rows are sku-major
+    n_series = n_skus * n_stores
+    series_sku = np.repeat(np.arange(n_skus), n_stores)
+    series_store = np.tile(np.arange(n_stores), n_skus)
+    series_cat = cat_idx[series_sku]
+
+    dates = pd.date_range(end=end_date, periods=days, freq='D')
+    dow = dates.dayofweek.values
+    doy = dates.dayofyear.values
+
+    # Base demand: category mean scaled by a lognormal SKU popularity and store size
+    cat_demand = np.array([CATEGORIES[c]['demand'] for c in categories])
+    sku_scale = rng.lognormal(0.0, 0.6, size=n_skus)
+    store_scale = rng.lognormal(0.0, 0.3, size=n_stores) if n_stores > 1 else np.ones(1)
+    base = cat_demand[series_cat] * sku_scale[series_sku] * store_scale[series_store]
+
+    # Weekly and yearly seasonality plus a slow trend
+    weekly = np.array([CATEGORIES[c]['weekly'] for c in categories])[series_cat][:, dow]
+    phase = rng.uniform(0, 2 * np.pi, size=n_series)[:, None]
+    yearly = 1 + 0.15 * np.sin(2 * np.pi * doy[None, :] / 365.25 + phase)
+    trend = 1 + rng.normal(0, 0.1, size=n_series)[:, None] * np.linspace(0, 1, days)[None, :]
+
+    # Promotions: roughly 1 in 30 days starts a 3-7 day promo at 10-40% off, per SKU
+    promo_start = rng.random((n_skus, days)) < 1 / 30
+    promo_len = rng.integers(3, 8, size=(n_skus, days))
+    promo_discount = np.round(rng.uniform(0.1, 0.4, size=(n_skus, days)), 2)
+    discount = np.zeros((n_skus, days))
+    for offset in range(7):
+        active = promo_start & (promo_len > offset)
+        shifted = np.zeros_like(discount)
+        shifted[:, offset:] = np.where(active, promo_discount, 0)[:, :days - offset]
+        discount = np.maximum(discount, shifted)
+
+    elasticity = np.array([ELASTICITY[c] for c in categories])[cat_idx]
+    uplift = 1 - elasticity[:, None] * discount
+    price = np.round(base_price[:, None] * (1 - discount), 2)
+
+    expected = base[:, None] * weekly * yearly * np.clip(trend, 0.5, None) * uplift[series_sku]
+    units = rng.poisson(expected)
+
+    date_strings = dates.strftime('%Y-%m-%d').values
+    sales = pd.DataFrame({
+        'date': np.tile(date_strings, n_series),
+        'product_id': np.repeat(product_ids[series_sku], days),
+        'store_id': np.repeat(np.array([f'STORE{s + 1:03d}' for s in range(n_stores)])[series_store], days),
+        'units_sold': units.ravel(),
+        'price': price[series_sku].ravel()
+    })
+
+    # Inventory: stock covers the remaining shelf life with a random over/under-order factor
+    life_hi = np.array([CATEGORIES[c]['shelf_life'][1] for c in categories])[series_cat]
+    days_left = rng.integers(-1, life_hi + 1)
+    recent_demand = expected[:, -7:].mean(axis=1)
+    predicted = recent_demand * np.clip(days_left, 1, None)
+    stock = np.maximum(0, np.round(predicted * rng.lognormal(0.1, 0.5, size=n_series))).astype(int)
+
+    status = np.where(days_left < 0, 'expired',
+             np.where(days_left <= 2, 'expiring',
+             np.where(stock > predicted * 1.5, 'overstock', 'safe')))
+    # Sales end yesterday; the day after is "today" and expiry dates count from there.
+    # The extra day keeps the integer days_until_expiry computed in SQL equal to days_left.
+    today = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+    expiry = (today + pd.to_timedelta(days_left + 1, unit='D')).strftime('%Y-%m-%d')
+
+    inventory = pd.DataFrame({
+        'product_id': product_ids[series_sku],
+        'store_id': np.array([f'STORE{s + 1:03d}' for s in range(n_stores)])[series_store],
+        'stock': stock,
+        'expiry_date': expiry,
+        'status': status,
+        'predicted_demand': np.round(predicted, 1)
+    })
+
+    return products, inventory, sales
+
+def generate_dataset(n_skus, days, n_stores=1, seed=42, chunk_rows=2_000_000, end_date=None):
+    """Yield (products, inventory, sales) DataFrame chunks with bounded memory"""
+    rng = np.random.default_rng(seed)
+    end_date = end_date or (datetime.now() - timedelta(days=1)).date()
+    skus_per_chunk = max(1, chunk_rows // max(1, days * n_stores))
+
+    for start in range(0, n_skus, skus_per_chunk):
+        yield generate_chunk(rng, start, min(skus_per_chunk, n_skus - start), days, n_stores, end_date)
+
+def generate_stores(n_stores, seed=42):
+    """Stores scattered around regional hubs, so nearby stores can share stock"""
+    rng = np.random.default_rng([seed, n_stores])
+    hubs = np.array([[36.37, -94.21], [32.78, -96.80], [41.88, -87.63], [33.75, -84.39], [34.05, -118.24]])
+    hub = rng.integers(0, len(hubs), size=n_stores)
+    coords = hubs[hub] + rng.normal(0, 0.6, size=(n_stores, 2))
+    store_ids = [f'STORE{s + 1:03d}' for s in range(n_stores)]
+    return pd.DataFrame({
+        'store_id': store_ids,
+        'store_name': [f'Store {s + 1}' for s in range(n_stores)],
+        'latitude': np.round(coords[:, 0], 4),
+        'longitude': np.round(coords[:, 1], 4)
+    })
+
+def write_db(chunks, db_path, replace=False, stores=None):
+    """Write chunks into a SQLite database through DataLoader.bulk_load"""
+    loader = DataLoader(db_path)
+    if replace:
+        conn = sqlite3.connect(db_path)
+        with conn:
+            for table in ('sales_history', 'inventory', 'products', 'stores'):
+                conn.execute(f'DELETE FROM {table}')
+        conn.close()
+
+    if stores is not None:
+        loader.bulk_load(stores_df=stores)
+
+    totals = [0, 0]
+    for products, inventory, sales in chunks:
+        loader.bulk_load(products_df=products, inventory_df=inventory, sales_df=sales)
+        totals[0] += len(products)
+        totals[1] += len(sales)
+    return totals
+
+def write_shards(chunks, path, shards, replace=False, stores=None):
+    """Write each product's rows into path/<shard>/inventory.db of its owning shard; stores go to every shard"""
+    ring = HashRing(shards)
+    loaders = {}
+    for shard in shards:
+        os.makedirs(os.path.join(path, shard), exist_ok=True)
+        db_path = os.path.join(path, shard, 'inventory.db')
+        write_db([], db_path, replace=replace, stores=stores)
+        loaders[shard] = DataLoader(db_path)
+
+    totals = [0, 0]
+    for products, inventory, sales in chunks:
+        owners = products['product_id'].map(ring.shard_for)
+        for shard, product_ids in products['product_id'].groupby(owners):
+            loaders[shard].bulk_load(products_df=products[products['product_id'].isin(product_ids)],
+                                     inventory_df=inventory[inventory['product_id'].isin(product_ids)],
+                                     sales_df=sales[sales['product_id'].isin(product_ids)])
+        totals[0] += len(products)
+        totals[1] += len(sales)
+    return totals
+
+def write_files(chunks, path, fmt, stores=None):
+    """Write chunks as CSV (the camelCase layout load_csv_data reads) or Parquet part files"""
+    os.makedirs(path, exist_ok=True)
+    totals = [0, 0]
+
+    if stores is not None:
+        if fmt == 'csv':
+            stores.to_csv(os.path.join(path, 'stores.csv'), index=False)
+        else:
+            stores.to_parquet(os.path.join(path, 'stores.parquet'), index=False)
+
+    for part, (products, inventory, sales) in enumerate(chunks):
+        inventory = inventory.merge(products, on='product_id')
+        inventory_out = pd.DataFrame({
+            'productId': inventory['product_id'],
+            'productName': inventory['product_name'],
+            'category': inventory['category'],
+            'storeId': inventory['store_id'],
+            'stock': inventory['stock'],
+            'expiryDate': inventory['expiry_date'],
+            'currentPrice': inventory['current_price'],
+            'predictedDemand': inventory['predicted_demand']
+        })
+        sales_out = pd.DataFrame({
+            'date': sales['date'],
+            'productId': sales['product_id'],
+            'storeId': sales['store_id'],
+            'unitsSold': sales['units_sold'],
+            'price': sales['price']
+        })
+
+        if fmt == 'csv':
+            header = part == 0
+            mode = 'w' if part == 0 else 'a'
+            inventory_out.to_csv(os.path.join(path, 'inventory.csv'), index=False, header=header, mode=mode)
+            sales_out.to_csv(os.path.join(path, 'sales.csv'), index=False, header=header, mode=mode)
+        else:
+            try:
+                inventory_out.to_parquet(os.path.join(path, f'inventory-{part:05d}.parquet'), index=False)
+                sales_out.to_parquet(os.path.join(path, f'sales-{part:05d}.parquet'), index=False)
+            except ImportError as e:
+                raise SystemExit(f"Parquet output requires pyarrow: {e}")
+
+        totals[0] += len(products)
+        totals[1] += len(sales)
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a seeded synthetic inventory dataset')
+    parser.add_argument('--skus', type=int, default=1000, help='Number of products')
+    parser.add_argument('--days', type=int, default=365, help='Days of sales history')
+    parser.add_argument('--stores', type=int, default=1, help='Number of stores')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--output', choices=['db', 'csv', 'parquet'], default='db', help='Output format')
+    parser.add_argument('--path', default='synthetic.db', help='Database file or output directory')
+    parser.add_argument('--replace', action='store_true', help='Clear existing rows before writing to a database')
+    parser.add_argument('--end-date', help='Last sales date as YYYY-MM-DD (default: yesterday)')
+    parser.add_argument('--chunk-rows', type=int, default=2_000_000, help='Sales rows generated per chunk')
+    parser.add_argument('--shards', help='Comma-separated shard names; writes one database per shard under --path')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    end_date = datetime.strptime(args.end_date, '%Y-%m-%d').date() if args.end_date else None
+    chunks = generate_dataset(args.skus, args.days, args.stores, args.seed, args.chunk_rows, end_date)
+    stores = generate_stores(args.stores, args.seed)
+
+    if args.shards:
+        n_products, n_sales = write_shards(chunks, args.path, args.shards.split(','), replace=args.replace,
+                                           stores=stores)
+    elif args.output == 'db':
+        n_products, n_sales = write_db(chunks, args.path, replace=args.replace, stores=stores)
+    else:
+        n_products, n_sales = write_files(chunks, args.path, args.output, stores=stores)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Wrote {n_products} products and {n_sales} sales rows to {args.path} in {elapsed:.1f}s")
+
+if __name__ == '__main__':
+    main()
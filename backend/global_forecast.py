@@ -0,0 +1,208 @@
+import pandas as pd
+import numpy as np
+from sklearn.linear_model import Ridge
+from datetime import datetime, timedelta
+import logging
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+class GlobalForecaster:
+    """Single demand model pooled across all SKUs.
+
+    Each SKU's history is divided by its demand level (mean daily units), so
+    one regression learns shared dynamics: normalized lags and moving
+    averages plus a day-of-week profile per category. Predictions are scaled
+    back by the SKU level. SKUs with little or no history borrow their
+    category's level, so cold-start products still get a real forecast.
+    """
+
+    LAG_FEATURES = ['lag1', 'lag7', 'ma7', 'ma14']
+
+    def __init__(self, alpha=1.0, prior_days=7):
+        self.alpha = alpha
+        # Days of own history weighted equally with the category level when shrinking
+        self.prior_days = prior_days
+        self.model = None
+        self.categories = []
+        self.sku_levels = {}
+        self.sku_categories = {}
+        self.category_levels = {}
+        self.category_std = {}
+        self.global_level = 1.0
+        self.residual_std = 0.0
+        self.trained_at = None
+
+    @property
+    def is_fitted(self):
+        return self.model is not None
+
+    def _design(self, normalized_lags, dow, category_idx):
+        """Build the feature matrix: normalized lag features and category x day-of-week dummies"""
+        n = len(dow)
+        interactions = np.zeros((n, 7 * len(self.categories)))
+        valid = category_idx >= 0
+        interactions[np.flatnonzero(valid), category_idx[valid] * 7 + dow[valid]] = 1.0
+        return np.hstack([normalized_lags, interactions])
+
+    @staticmethod
+    def _lag_features(df):
+        """Lagged demand features per SKU, using only days before each row"""
+        grouped = df.groupby('product_id', sort=False)['units_sold']
+        position = grouped.cumcount().values
+        cumsum = grouped.cumsum().values
+        prev_cumsum = cumsum - df['units_sold'].values
+
+        features = {}
+        features['lag1'] = grouped.shift(1).values
+        features['lag7'] = grouped.shift(7).values
+        for window in (7, 14):
+            # Sum of the previous `window` days from cumulative sums, no per-group rolling
+            shifted = pd.Series(cumsum).groupby(df['product_id'].values, sort=False).shift(window + 1).fillna(0).values
+            count = np.minimum(position, window)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                features[f'ma{window}'] = np.where(count > 0, (prev_cumsum - shifted) / count, np.nan)
+        return features
+
+    @timed('train_global_model')
+    def fit(self, history_df, product_categories):
+        """Fit the pooled model.
+
+        history_df has product_id, date and units_sold columns for every SKU;
+        product_categories maps product_id to category.
+        """
+        if history_df.empty:
+            logger.warning("No sales history to fit the global model")
+            return None
+
+        df = history_df[['product_id', 'date', 'units_sold']].copy()
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.sort_values(['product_id', 'date'], kind='mergesort').reset_index(drop=True)
+
+        self.sku_categories = dict(product_categories)
+        self.categories = sorted(set(self.sku_categories.values()))
+        category_index = {c: i for i, c in enumerate(self.categories)}
+
+        levels = df.groupby('product_id', sort=False)['units_sold'].mean().clip(lower=1.0)
+        self.sku_levels = levels.to_dict()
+        self.global_level = float(levels.mean())
+        level_categories = levels.index.map(lambda p: self.sku_categories.get(p))
+        self.category_levels = levels.groupby(level_categories).mean().to_dict()
+
+        features = self._lag_features(df)
+        level = df['product_id'].map(self.sku_levels).values
+        lags = np.column_stack([features[name] for name in self.LAG_FEATURES]) / level[:, None]
+        # Early rows lack a full window; fall back to the shorter lag, then the SKU level
+        lags[:, 1] = np.where(np.isnan(lags[:, 1]), lags[:, 0], lags[:, 1])
+        lags = np.where(np.isnan(lags), 1.0, lags)
+
+        keep = ~np.isnan(features['lag1'])
+        category_idx = df['product_id'].map(lambda p: category_index.get(self.sku_categories.get(p), -1)).values
+        X = self._design(lags[keep], df['date'].dt.dayofweek.values[keep], category_idx[keep])
+        y = df['units_sold'].values[keep] / level[keep]
+
+        model = Ridge(alpha=self.alpha)
+        model.fit(X, y)
+
+        residuals = y - model.predict(X)
+        self.residual_std = float(residuals.std())
+        kept_categories = category_idx[keep]
+        self.category_std = {
+            c: float(residuals[kept_categories == i].std())
+            for c, i in category_index.items() if np.any(kept_categories == i)
+        }
+
+        self.model = model
+        self.trained_at = datetime.now()
+        logger.info(f"Global model fitted on {len(y)} rows across {len(levels)} SKUs")
+        return model
+
+    def _level(self, product_id, category, history):
+        """SKU demand level, shrunk toward the category level for short histories"""
+        if product_id in self.sku_levels and len(history) >= self.prior_days:
+            return self.sku_levels[product_id]
+        prior = self.category_levels.get(category, self.global_level)
+        n = len(history)
+        if n == 0:
+            return prior
+        return max(1.0, (n * float(np.mean(history)) + self.prior_days * prior) / (n + self.prior_days))
+
+    def forecast(self, product_id, sales_df, days=7, category=None):
+        """Generate a forecast for one SKU in the same format as DemandForecaster.forecast"""
+        category = category or self.sku_categories.get(product_id)
+        category_idx = self.categories.index(category) if category in self.categories else -1
+
+        if sales_df is not None and not sales_df.empty:
+            history = sales_df['units_sold'].astype(float).tolist()[-14:]
+            last_date = pd.to_datetime(sales_df['date'].iloc[-1])
+        else:
+            history = []
+            last_date = pd.Timestamp(datetime.now().date()) - timedelta(days=1)
+
+        level = self._level(product_id, category, history)
+        std = self.category_std.get(category, self.residual_std) * level
+        window = [h / level for h in history] or [1.0]
+
+        forecasts = []
+        for i in range(days):
+            forecast_date = last_date + timedelta(days=i + 1)
+            lags = np.array([[
+                window[-1],
+                window[-7] if len(window) >= 7 else window[-1],
+                np.mean(window[-7:]),
+                np.mean(window[-14:])
+            ]])
+            X = self._design(lags, np.array([forecast_date.dayofweek]), np.array([category_idx]))
+            normalized = max(0.0, float(self.model.predict(X)[0]))
+            window.append(normalized)
+
+            prediction = normalized * level
+            forecasts.append({
+                'date': forecast_date.strftime('%Y-%m-%d'),
+                'predicted': round(prediction, 1),
+                'confidence_lower': round(max(0, prediction - 1.96 * std), 1),
+                'confidence_upper': round(prediction + 1.96 * std, 1)
+            })
+
+        return forecasts
+
+    def forecast_many(self, history_df, days=7, product_categories=None):
+        """Point forecasts for every SKU in history_df at once, as a (n_skus, days) array and the product order.
+
+        Matches forecast() per SKU, but each day is one prediction over all SKUs.
+        """
+        product_categories = product_categories or {}
+        df = history_df[['product_id', 'date', 'units_sold']]
+        grouped = df.groupby('product_id', sort=False)
+        product_ids = list(grouped.groups)
+        # The last 14 days of each SKU, right-aligned in a NaN-padded matrix
+        tail = grouped.tail(14)
+        position = tail.groupby('product_id', sort=False).cumcount(ascending=False).to_numpy()
+        rows = pd.Index(product_ids).get_indexer(tail['product_id'])
+        history = np.full((len(product_ids), 14), np.nan)
+        history[rows, 13 - position] = tail['units_sold'].to_numpy(dtype=float)
+        n = np.sum(~np.isnan(history), axis=1)
+        last_date = pd.to_datetime(grouped['date'].last().reindex(product_ids)).to_numpy(dtype='datetime64[D]')
+
+        categories = [product_categories.get(pid) or self.sku_categories.get(pid) for pid in product_ids]
+        category_index = {c: i for i, c in enumerate(self.categories)}
+        category_idx = np.array([category_index.get(c, -1) for c in categories])
+
+        # Same shrinkage as _level, for all SKUs at once
+        prior = np.array([self.category_levels.get(c, self.global_level) for c in categories])
+        own = np.array([self.sku_levels.get(pid, np.nan) for pid in product_ids])
+        shrunk = np.maximum(1.0, (n * np.nanmean(history, axis=1) + self.prior_days * prior) / (n + self.prior_days))
+        level = np.where(~np.isnan(own) & (n >= self.prior_days), own, shrunk)
+
+        window = np.hstack([history / level[:, None], np.full((len(product_ids), days), np.nan)])
+        predicted = np.empty((len(product_ids), days))
+        for i in range(days):
+            end = 14 + i
+            last = window[:, end - 1]
+            lag7 = np.where(n + i >= 7, window[:, end - 7], last)
+            lags = np.column_stack([last, lag7, np.nanmean(window[:, end - 7:end], axis=1),
+                                    np.nanmean(window[:, end - 14:end], axis=1)])
+            dow = (last_date.astype('int64') + i + 1 + 3) % 7  # 1970-01-01 was a Thursday
+            window[:, end] = np.maximum(0.0, self.model.predict(self._design(lags, dow, category_idx)))
+            predicted[:, i] = window[:, end] * level
+        return predicted, product_ids
@@ -0,0 +1,291 @@
+import pandas as pd
+import numpy as np
+from datetime import timedelta
+import itertools
+import threading
+import logging
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+class HoltWintersEngine:
+    """Vectorized damped-trend Holt-Winters smoothing over many series at once.
+
+    State is held as arrays with one row per SKU: level, trend and a 7-slot
+    additive weekly season indexed by day of week. Each day is one NumPy
+    update across every series, so fitting thousands of SKUs costs one pass
+    over the days. Afterwards add_sales() folds committed sales in: units are
+    held per day until the day is over, then applied with update(), so the
+    state only ever reflects complete days.
+    """
+
+    SEASON_LENGTH = 7
+
+    def __init__(self, alphas=(0.1, 0.2, 0.35, 0.5), betas=(0.02,), gammas=(0.1, 0.25), phi=0.98):
+        # Smoothing parameters are chosen per series from this grid by one-step-ahead error
+        self.grid = list(itertools.product(alphas, betas, gammas))
+        self.phi = phi
+        self.index = {}
+        self.product_ids = []
+        self.level = np.zeros(0)
+        self.trend = np.zeros(0)
+        self.season = np.zeros((0, self.SEASON_LENGTH))
+        self.alpha = np.zeros(0)
+        self.beta = np.zeros(0)
+        self.gamma = np.zeros(0)
+        self.sse = np.zeros(0)
+        self.n_obs = np.zeros(0)
+        self.last_date = {}
+        # Units for days not yet over, {date: {product_id: units}}
+        self.pending = {}
+        self._lock = threading.RLock()
+
+    @property
+    def is_fitted(self):
+        return len(self.index) > 0
+
+    def _init_state(self, Y):
+        """Initial level, trend and season from the first two weeks of each series"""
+        first = Y[:, :self.SEASON_LENGTH]
+        level = np.nanmean(first, axis=1)
+        level = np.where(np.isnan(level), np.nanmean(Y, axis=1), level)
+        level = np.nan_to_num(level)
+        if Y.shape[1] >= 2 * self.SEASON_LENGTH:
+            second = np.nanmean(Y[:, self.SEASON_LENGTH:2 * self.SEASON_LENGTH], axis=1)
+            trend = np.nan_to_num((second - level) / self.SEASON_LENGTH)
+        else:
+            trend = np.zeros(len(Y))
+        season = np.nan_to_num(first - level[:, None])
+        if season.shape[1] < self.SEASON_LENGTH:
+            season = np.pad(season, ((0, 0), (0, self.SEASON_LENGTH - season.shape[1])))
+        return level, trend, season
+
+    def _run(self, Y, dow, level, trend, season, alpha, beta, gamma):
+        """Apply the recurrences over the columns of Y; NaN cells leave the state unchanged"""
+        sse = np.zeros(len(Y))
+        n_obs = np.zeros(len(Y))
+        phi = self.phi
+
+        for t in range(Y.shape[1]):
+            y = Y[:, t]
+            observed = ~np.isnan(y)
+            slot = dow[t]
+            s = season[:, slot]
+
+            forecast = level + phi * trend + s
+            error = np.where(observed, y - forecast, 0.0)
+            sse += error ** 2
+            n_obs += observed
+
+            new_level = alpha * (np.where(observed, y, forecast) - s) + (1 - alpha) * (level + phi * trend)
+            new_trend = beta * (new_level - level) + (1 - beta) * phi * trend
+            new_season = gamma * (np.where(observed, y, forecast) - new_level) + (1 - gamma) * s
+
+            level = np.where(observed, new_level, level + phi * trend)
+            trend = np.where(observed, new_trend, phi * trend)
+            season[:, slot] = np.where(observed, new_season, s)
+
+        return level, trend, season, sse, n_obs
+
+    @timed('train_holt_winters')
+    def fit(self, history_df, through=None):
+        """Fit every series in a long DataFrame of product_id, date, units_sold.
+
+        Days after `through` (e.g. today, still in progress) are not fitted but
+        held as pending and applied by add_sales() once they are over.
+        """
+        df = history_df[['product_id', 'date', 'units_sold']].copy()
+        df['date'] = pd.to_datetime(df['date'])
+        later = df.iloc[0:0]
+        if through is not None:
+            later = df[df['date'] > pd.Timestamp(through)]
+            df = df[df['date'] <= pd.Timestamp(through)]
+        if df.empty:
+            return self
+
+        matrix = df.pivot_table(index='product_id', columns='date', values='units_sold', aggfunc='sum')
+        dates = pd.date_range(matrix.columns.min(), matrix.columns.max(), freq='D')
+        matrix = matrix.reindex(columns=dates)
+
+        Y = matrix.to_numpy(dtype=float)
+        n, k = len(Y), len(self.grid)
+        dow = dates.dayofweek.values
+
+        # Run every parameter combination for every series in one stacked pass
+        level, trend, season = self._init_state(Y)
+        params = np.array(self.grid)
+        stacked = self._run(
+            np.tile(Y, (k, 1)), dow,
+            np.tile(level, k), np.tile(trend, k), np.tile(season, (k, 1)),
+            np.repeat(params[:, 0], n), np.repeat(params[:, 1], n), np.repeat(params[:, 2], n)
+        )
+        sse = stacked[3].reshape(k, n)
+        best = np.argmin(sse, axis=0)
+        pick = best * n + np.arange(n)
+
+        with self._lock:
+            self.product_ids = list(matrix.index)
+            self.index = {pid: i for i, pid in enumerate(self.product_ids)}
+            self.level, self.trend, self.season = stacked[0][pick], stacked[1][pick], stacked[2][pick]
+            self.sse, self.n_obs = sse[best, np.arange(n)], stacked[4][pick]
+            self.alpha, self.beta, self.gamma = params[best, 0], params[best, 1], params[best, 2]
+            # Every series was stepped through the last date, observed or not
+            self.last_date = dict.fromkeys(self.product_ids, dates[-1])
+            self.pending = {}
+            self._add_pending(later)
+        logger.info(f"Holt-Winters fitted {n} series over {len(dates)} days")
+        return self
+
+    def fit_series(self, sales_df):
+        """Fit a single series without touching the stored state; returns a state tuple"""
+        df = sales_df[['date', 'units_sold']].copy()
+        df['date'] = pd.to_datetime(df['date'])
+        series = df.groupby('date')['units_sold'].sum()
+        dates = pd.date_range(series.index.min(), series.index.max(), freq='D')
+        Y = series.reindex(dates).to_numpy(dtype=float)[None, :]
+
+        level, trend, season = self._init_state(Y)
+        k = len(self.grid)
+        params = np.array(self.grid)
+        level, trend, season, sse, n_obs = self._run(
+            np.tile(Y, (k, 1)), dates.dayofweek.values,
+            np.tile(level, k), np.tile(trend, k), np.tile(season, (k, 1)),
+            params[:, 0], params[:, 1], params[:, 2]
+        )
+        best = int(np.argmin(sse))
+        return level[best], trend[best], season[best], sse[best] / max(1, n_obs[best]), params[best, 0], dates[-1]
+
+    def add_sales(self, sales_df, today=None):
+        """Fold committed sales rows (product_id, date, units_sold) into the state.
+
+        Days that are over are applied at once; the current day waits in pending.
+        Sales dated on or before a product's last_date cannot change the state.
+        """
+        df = sales_df[['product_id', 'date', 'units_sold']].copy()
+        df['date'] = pd.to_datetime(df['date'])
+        with self._lock:
+            self._add_pending(df)
+            self.apply_complete_days(today)
+
+    def _add_pending(self, df):
+        daily = df.groupby(['date', 'product_id'])['units_sold'].sum()
+        for (date, product_id), units in daily.items():
+            if product_id in self.index and date > self.last_date[product_id]:
+                day = self.pending.setdefault(date, {})
+                day[product_id] = day.get(product_id, 0) + units
+
+    def apply_complete_days(self, today=None):
+        """Apply pending days before today with update()"""
+        today = pd.Timestamp(today or pd.Timestamp.now()).normalize()
+        with self._lock:
+            for date in sorted(d for d in self.pending if d < today):
+                day = self.pending.pop(date)
+                self.update(list(day), list(day.values()), date)
+
+    def update(self, product_ids, values, date):
+        """Apply one new day of observations for the given products incrementally"""
+        with self._lock:
+            self._update(product_ids, values, pd.Timestamp(date))
+
+    def _update(self, product_ids, values, date):
+        known = [(self.index[pid], v) for pid, v in zip(product_ids, values) if pid in self.index]
+        if not known:
+            return
+        rows = np.array([row for row, _ in known])
+        y = np.array([v for _, v in known], dtype=float)
+
+        # Dampen forward across any skipped days before applying the observation
+        gaps = np.array([(date - self.last_date[self.product_ids[row]]).days for row in rows])
+        for _ in range(int(gaps.max()) - 1):
+            stepping = gaps > 1
+            self.level[rows[stepping]] += self.phi * self.trend[rows[stepping]]
+            self.trend[rows[stepping]] *= self.phi
+            gaps = np.where(stepping, gaps - 1, gaps)
+        fresh = gaps >= 1
+
+        rows, y = rows[fresh], y[fresh]
+        level, trend, season, sse, n_obs = self._run(
+            y[:, None], np.array([date.dayofweek]),
+            self.level[rows], self.trend[rows], self.season[rows].copy(),
+            self.alpha[rows], self.beta[rows], self.gamma[rows]
+        )
+        self.level[rows], self.trend[rows], self.season[rows] = level, trend, season
+        self.sse[rows] += sse
+        self.n_obs[rows] += n_obs
+        for row in rows:
+            self.last_date[self.product_ids[row]] = date
+
+    def _project(self, level, trend, season, mse, alpha, last_date, days):
+        steps = np.arange(1, days + 1)
+        damped = np.cumsum(self.phi ** steps)
+        dates = pd.date_range(last_date + timedelta(days=1), periods=days, freq='D')
+        predicted = np.maximum(0.0, level + damped * trend + season[dates.dayofweek.values])
+        std = np.sqrt(mse * (1 + (steps - 1) * alpha ** 2))
+
+        return [
+            {
+                'date': d.strftime('%Y-%m-%d'),
+                'predicted': round(float(p), 1),
+                'confidence_lower': round(float(max(0.0, p - 1.96 * s)), 1),
+                'confidence_upper': round(float(p + 1.96 * s), 1)
+            }
+            for d, p, s in zip(dates, predicted, std)
+        ]
+
+    def forecast(self, product_id, sales_df=None, days=7):
+        """Forecast one SKU from stored state, or refit from sales_df if it has complete days the state lacks"""
+        history_end = pd.to_datetime(sales_df['date'].iloc[-1]) if sales_df is not None and not sales_df.empty else None
+        # The current day is still in progress, so only days before it can be missing from the state
+        last_complete = pd.Timestamp.now().normalize() - timedelta(days=1)
+
+        with self._lock:
+            self.apply_complete_days()
+            row = self.index.get(product_id)
+            if row is not None and (history_end is None or min(history_end, last_complete) <= self.last_date[product_id]):
+                state = (self.level[row], self.trend[row], self.season[row].copy(),
+                         self.sse[row] / max(1, self.n_obs[row]), self.alpha[row], self.last_date[product_id])
+            else:
+                state = None
+        if state is not None:
+            return self._project(*state, days)
+
+        if history_end is None:
+            return None
+        return self.forecast_series(sales_df, days)
+
+    def forecast_series(self, sales_df, days=7):
+        """Fit sales_df alone and forecast the days after its last date, ignoring the stored state"""
+        return self._project(*self.fit_series(sales_df), days)
+
+    def forecast_all(self, days=7):
+        """Point forecasts for every fitted series as a (n_skus, days) array and the product order"""
+        steps = np.arange(1, days + 1)
+        damped = np.cumsum(self.phi ** steps)
+        with self._lock:
+            self.apply_complete_days()
+            last = np.array([self.last_date[pid] for pid in self.product_ids], dtype='datetime64[D]')
+            dow = (last.astype('int64')[:, None] + steps[None, :] + 3) % 7  # 1970-01-01 was a Thursday
+            rows = np.arange(len(self.product_ids))
+            predicted = self.level[:, None] + damped[None, :] * self.trend[:, None] + self.season[rows[:, None], dow]
+            return np.maximum(0.0, predicted), list(self.product_ids)
+
+    def forecast_mean(self, history_df, days=7):
+        """Mean daily forecast over `days` for every SKU in history_df, as a Series indexed by product_id.
+
+        SKUs the state covers come from one forecast_all() pass; those with complete
+        days the state never saw are refitted one by one, as in forecast().
+        """
+        history_end = pd.to_datetime(history_df.groupby('product_id', sort=False)['date'].last())
+        last_complete = pd.Timestamp.now().normalize() - timedelta(days=1)
+        with self._lock:
+            predicted, product_ids = self.forecast_all(days)
+            state_end = pd.to_datetime(pd.Series([self.last_date[pid] for pid in product_ids], index=product_ids))
+
+        demand = pd.Series(np.round(predicted, 1).mean(axis=1), index=product_ids).reindex(history_end.index)
+        stale = demand.isna() | (history_end.clip(upper=last_complete) > state_end.reindex(history_end.index))
+        if stale.any():
+            groups = history_df.groupby('product_id', sort=False)
+            for product_id in demand.index[stale.to_numpy()]:
+                forecast = self._project(*self.fit_series(groups.get_group(product_id)), days)
+                demand[product_id] = np.mean([day['predicted'] for day in forecast])
+        return demand
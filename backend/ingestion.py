@@ -0,0 +1,208 @@
+import pandas as pd
+import math
+import threading
+import time
+import logging
+from datetime import datetime
+from data_loader import DEFAULT_STORE_ID
+from metrics import sales_events, sales_batches
+
+logger = logging.getLogger(__name__)
+
+class SalesIngestor:
+    """Buffer POS sale events and write them to the database in micro-batches.
+
+    submit() validates events and appends them to an in-memory buffer. A
+    background thread flushes the buffer once max_batch events are waiting
+    or the oldest event has waited max_delay seconds. A flush aggregates the
+    events to one row per (date, product, store) and commits them in one
+    transaction. Listeners are then called with the committed rows, so
+    downstream caches only touch the SKUs in the batch. Events have already
+    been acknowledged, so a batch that fails to commit goes back to the front
+    of the buffer and is retried with exponential backoff.
+    """
+
+    # Larger counts would overflow SQLite integers and fail every retry of their batch
+    MAX_UNITS = 2 ** 31 - 1
+
+    def __init__(self, data_loader, max_batch=500, max_delay=0.2, retry_delay=0.1, max_retry_delay=5.0):
+        self.data_loader = data_loader
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.listeners = []
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._worker = None
+        self._retry_at = None
+        self.failed_attempts = 0
+        self.batches_committed = 0
+        self.last_batch = None
+
+    def add_listener(self, listener):
+        """Register listener(sales_df, data_version), called after each committed batch with the version it produced"""
+        self.listeners.append(listener)
+
+    def start(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='sales-ingestor', daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout=5):
+        """Stop the flush thread after writing whatever is buffered"""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        self._worker = None
+        self.flush()
+        if self._buffer:
+            logger.error(f"Stopped with {len(self._buffer)} sale events that could not be committed")
+
+    @staticmethod
+    def _finite(value):
+        """value as a finite float, or None for non-numbers, booleans, NaN, infinities and oversized integers"""
+        # JSON parsing turns 1e400 into infinity and accepts NaN
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        try:
+            value = float(value)
+        except OverflowError:
+            return None
+        return value if math.isfinite(value) else None
+
+    @staticmethod
+    def parse_event(event, default_date):
+        """Normalize one event to (date, product_id, store_id, units_sold, price); raises ValueError"""
+        if not isinstance(event, dict) or not event.get('product_id'):
+            raise ValueError('product_id is required')
+        units = SalesIngestor._finite(event.get('units_sold', event.get('quantity', 1)))
+        if units is None or units != int(units) or not 0 < units <= SalesIngestor.MAX_UNITS:
+            raise ValueError('units_sold must be a positive integer')
+        price = event.get('price')
+        if price is not None:
+            price = SalesIngestor._finite(price)
+            if price is None or price < 0:
+                raise ValueError('price must be a non-negative number')
+
+        timestamp = event.get('timestamp')
+        if timestamp:
+            date = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00')).strftime('%Y-%m-%d')
+        else:
+            date = default_date
+        return (date, str(event['product_id']), str(event.get('store_id') or DEFAULT_STORE_ID),
+                int(units), price)
+
+    def submit(self, events):
+        """Validate and buffer a list of events; returns the number accepted.
+
+        The whole request is rejected with ValueError if any event is invalid.
+        """
+        default_date = datetime.now().strftime('%Y-%m-%d')
+        rows = []
+        for i, event in enumerate(events):
+            try:
+                rows.append(self.parse_event(event, default_date))
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"Invalid event at index {i}: {e}")
+
+        with self._wakeup:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.max_batch:
+                self._wakeup.notify()
+        sales_events.inc(len(rows))
+        return len(rows)
+
+    def pending(self):
+        return len(self._buffer)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._wakeup:
+                # Back off after a failed commit; new events wait in the buffer meanwhile
+                backoff = self._retry_at - time.monotonic() if self._retry_at is not None else 0
+                if backoff > 0:
+                    self._wakeup.wait(backoff)
+                    continue
+                if self._buffer and len(self._buffer) < self.max_batch:
+                    remaining = self._oldest + self.max_delay - time.monotonic()
+                    if remaining > 0:
+                        self._wakeup.wait(remaining)
+                elif not self._buffer:
+                    self._wakeup.wait(self.max_delay)
+            if self._buffer and (len(self._buffer) >= self.max_batch or
+                                 time.monotonic() - self._oldest >= self.max_delay):
+                self.flush()
+
+    def flush(self):
+        """Write buffered events now; returns the committed rows or None if there were none"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                oldest, self._oldest = self._oldest, None
+            if not rows:
+                return None
+
+            started = time.perf_counter()
+            try:
+                events = pd.DataFrame(rows, columns=['date', 'product_id', 'store_id', 'units_sold', 'price'])
+                if events['price'].isna().any():
+                    prices = self._current_prices(events.loc[events['price'].isna(), 'product_id'].unique().tolist())
+                    events['price'] = events['price'].fillna(events['product_id'].map(prices)).fillna(0.0)
+                sales_df = events.groupby(['date', 'product_id', 'store_id'], as_index=False, sort=False).agg(
+                    units_sold=('units_sold', 'sum'), price=('price', 'mean'))
+                version = self.data_loader.record_sales(sales_df)
+            except Exception as e:
+                # Keep the batch ahead of events that arrived since, and retry it after a delay
+                with self._lock:
+                    self._buffer[:0] = rows
+                    self._oldest = oldest
+                    self.failed_attempts += 1
+                    delay = min(self.max_retry_delay, self.retry_delay * 2 ** (self.failed_attempts - 1))
+                    self._retry_at = time.monotonic() + delay
+                sales_batches.inc(result='failed')
+                logger.error(f"Failed to commit sales batch of {len(rows)} events, retrying in {delay:.1f}s: {e}")
+                return None
+            with self._lock:
+                self.failed_attempts = 0
+                self._retry_at = None
+            sales_batches.inc(result='committed')
+            self.batches_committed += 1
+            self.last_batch = {
+                'events': len(rows),
+                'rows': len(sales_df),
+                'products': int(sales_df['product_id'].nunique()),
+                'commit_ms': round((time.perf_counter() - started) * 1000, 2),
+                'committed_at': datetime.now().isoformat()
+            }
+
+            for listener in self.listeners:
+                try:
+                    listener(sales_df, version)
+                except Exception as e:
+                    logger.error(f"Sales listener failed: {e}")
+            return sales_df
+
+    def _current_prices(self, product_ids):
+        return {item.product_id: item.current_price
+                for item in self.data_loader.get_inventory_records(product_ids=product_ids)}
+
+    def get_stats(self):
+        return {
+            'pending_events': self.pending(),
+            'batches_committed': self.batches_committed,
+            'max_batch': self.max_batch,
+            'max_delay_ms': int(self.max_delay * 1000),
+            'failed_attempts': self.failed_attempts,
+            'last_batch': self.last_batch
+        }
@@ -0,0 +1,236 @@
+import sqlite3
+import json
+import os
+import socket
+import time
+import uuid
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JobManager:
+    """Persistent background job runner backed by the SQLite database.
+
+    A job is a list of items processed in fixed-size chunks by a registered
+    handler. Each chunk's results are committed together with the progress
+    counter, so a restarted worker resumes from the last completed chunk.
+
+    Several processes can share one database. A job is run only by the
+    process that claims it, with an atomic UPDATE that sets its owner and a
+    lease. A heartbeat thread renews the leases of the jobs this process
+    holds and picks up jobs whose lease expired because their owner died.
+    """
+
+    def __init__(self, db_path='inventory.db', chunk_size=50, lease_seconds=60.0):
+        self.db_path = db_path
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None
+        self._heartbeat = None
+
+    def register(self, job_type, handler):
+        """Register a handler called as handler(params, items) for each chunk"""
+        self.handlers[job_type] = handler
+
+    def start(self):
+        """Start the worker and heartbeat threads and queue jobs left unfinished by a dead owner"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        self._stop.clear()
+        resumed = self._enqueue_expired()
+        if resumed:
+            logger.info(f"Resuming {resumed} unfinished job(s)")
+
+        self._worker = threading.Thread(target=self._run, name='job-worker', daemon=True)
+        self._worker.start()
+        self._heartbeat = threading.Thread(target=self._renew_leases, name='job-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def stop(self, timeout=5):
+        """Stop the worker thread after the chunk in progress"""
+        self._stop.set()
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join(timeout)
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout)
+        self._worker = None
+        self._heartbeat = None
+
+    def submit(self, job_type, items, params=None):
+        """Persist a new job and queue it for processing. Returns the job id."""
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+
+        job_id = uuid.uuid4().hex
+        conn = sqlite3.connect(self.db_path)
+        # The submitting process owns the pending job; others only take it if its lease runs out
+        conn.execute('''
+            INSERT INTO jobs (job_id, job_type, status, params, items, total, processed, owner, lease_until)
+            VALUES (?, ?, 'pending', ?, ?, ?, 0, ?, ?)
+        ''', (job_id, job_type, json.dumps(params or {}), json.dumps(list(items)), len(items),
+              self.owner, time.time() + self.lease_seconds))
+        conn.commit()
+        conn.close()
+
+        self._enqueue(job_id)
+        logger.info(f"Queued {job_type} job {job_id} with {len(items)} item(s)")
+        return job_id
+
+    def get_job(self, job_id, include_results=True):
+        """Get job status, progress and the results of all completed chunks"""
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute('''
+            SELECT job_id, job_type, status, total, processed, error, created_at, updated_at
+            FROM jobs WHERE job_id = ?
+        ''', (job_id,)).fetchone()
+
+        if row is None:
+            conn.close()
+            return None
+
+        job = {
+            'job_id': row[0],
+            'job_type': row[1],
+            'status': row[2],
+            'total': row[3],
+            'processed': row[4],
+            'progress': round(row[4] / row[3], 4) if row[3] else 1.0,
+            'error': row[5],
+            'created_at': row[6],
+            'updated_at': row[7]
+        }
+
+        if include_results:
+            results = []
+            for (chunk,) in conn.execute(
+                'SELECT result FROM job_results WHERE job_id = ? ORDER BY item_offset ASC', (job_id,)
+            ):
+                results.extend(json.loads(chunk))
+            job['results'] = results
+
+        conn.close()
+        return job
+
+    def _enqueue(self, job_id):
+        with self._queued_lock:
+            if job_id in self._queued:
+                return
+            self._queued.add(job_id)
+        self._queue.put(job_id)
+
+    def _enqueue_expired(self):
+        """Queue unfinished jobs whose owner stopped renewing their lease; returns how many"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('''
+            SELECT job_id FROM jobs
+            WHERE status IN ('pending', 'running') AND (lease_until IS NULL OR lease_until < ?)
+            ORDER BY created_at ASC
+        ''', (time.time(),)).fetchall()
+        conn.close()
+        for (job_id,) in rows:
+            self._enqueue(job_id)
+        return len(rows)
+
+    def _renew_leases(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                conn = sqlite3.connect(self.db_path)
+                with conn:
+                    conn.execute('''
+                        UPDATE jobs SET lease_until = ?
+                        WHERE owner = ? AND status IN ('pending', 'running')
+                    ''', (time.time() + self.lease_seconds, self.owner))
+                conn.close()
+                self._enqueue_expired()
+            except sqlite3.Error as e:
+                logger.error(f"Renewing job leases failed: {e}")
+
+    def _claim(self, job_id):
+        """Take a job for this process if it is ours or its lease expired; returns True if claimed"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            claimed = conn.execute('''
+                UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND status IN ('pending', 'running')
+                  AND (owner = ? OR lease_until IS NULL OR lease_until < ?)
+            ''', (self.owner, time.time() + self.lease_seconds, job_id, self.owner, time.time())).rowcount
+        conn.close()
+        return claimed == 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            job_id = self._queue.get()
+            if job_id is None:
+                break
+            with self._queued_lock:
+                self._queued.discard(job_id)
+            try:
+                self._process(job_id)
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                self._set_status(job_id, 'failed', error=str(e))
+
+    def _process(self, job_id):
+        if not self._claim(job_id):
+            return
+
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute(
+            'SELECT job_type, params, items, processed FROM jobs WHERE job_id = ?', (job_id,)
+        ).fetchone()
+        conn.close()
+
+        job_type, params, items, processed = row
+        handler = self.handlers.get(job_type)
+        if handler is None:
+            self._set_status(job_id, 'failed', error=f"No handler registered for {job_type}")
+            return
+
+        params = json.loads(params)
+        items = json.loads(items)
+
+        # Results are keyed by item offset, so a resumed job picks up where it stopped
+        for start in range(processed, len(items), self.chunk_size):
+            if self._stop.is_set():
+                return
+            chunk = items[start:start + self.chunk_size]
+            results = handler(params, chunk)
+
+            conn = sqlite3.connect(self.db_path)
+            with conn:
+                # Progress only counts while this process still owns the job
+                owned = conn.execute('''
+                    UPDATE jobs SET processed = ?, lease_until = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE job_id = ? AND owner = ?
+                ''', (start + len(chunk), time.time() + self.lease_seconds, job_id, self.owner)).rowcount
+                if owned:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO job_results (job_id, item_offset, result)
+                        VALUES (?, ?, ?)
+                    ''', (job_id, start, json.dumps(results, default=str)))
+            conn.close()
+            if not owned:
+                logger.warning(f"Job {job_id} was taken over by another worker after its lease expired")
+                return
+
+        self._set_status(job_id, 'completed')
+        logger.info(f"Job {job_id} completed")
+
+    def _set_status(self, job_id, status, error=None):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            UPDATE jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = ? AND owner = ?
+        ''', (status, error, job_id, self.owner))
+        conn.commit()
+        conn.close()
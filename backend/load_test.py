@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for the backend API.
+
+Requests arrive as a Poisson process at a fixed rate regardless of how fast
+the server answers, so queueing delay shows up in the latency numbers instead
+of silently lowering the offered load. Latency is measured from each
+request's scheduled arrival time.
+
+By default a server is started locally against a temporary database; pass
+--url to target one that is already running.
+
+Examples:
+    python load_test.py --rate 50 --duration 30
+    python load_test.py --rate 200 --duration 60 --skus 2000 --mix inventory=5,forecast=3,batch=1
+    python load_test.py --url http://localhost:5000 --rate 20 --output load.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+# Default mix approximates the dashboard: frequent inventory and summary polling,
+# per-product drill-downs and occasional batch markdown runs
+DEFAULT_MIX = {
+    'inventory': 35,
+    'analytics': 20,
+    'forecast': 20,
+    'sales_history': 10,
+    'markdown': 5,
+    'batch': 5,
+    'health': 5,
+}
+
+# Path and body builders take the generator's seeded rng, so a seed reproduces the requests too
+ENDPOINTS = {
+    'inventory': ('GET', lambda rng, ids: '/inventory', None),
+    'analytics': ('GET', lambda rng, ids: '/analytics/summary', None),
+    'forecast': ('GET', lambda rng, ids: f'/forecast/{rng.choice(ids)}', None),
+    'sales_history': ('GET', lambda rng, ids: f'/products/{rng.choice(ids)}/sales-history', None),
+    'markdown': ('GET', lambda rng, ids: f'/markdown/{rng.choice(ids)}', None),
+    'batch': ('POST', lambda rng, ids: '/markdown/batch',
+              lambda rng, ids: {'product_ids': rng.sample(ids, min(10, len(ids)))}),
+    'health': ('GET', lambda rng, ids: '/health', None),
+}
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{name}', expected one of {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+class LocalServer:
+    """Start app.py in a subprocess against a temporary database"""
+
+    def __init__(self, skus=0, days=90, seed=42):
+        self.skus = skus
+        self.days = days
+        self.seed = seed
+        self.workdir = None
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        self.workdir = tempfile.mkdtemp(prefix='loadtest-')
+        db_path = os.path.join(self.workdir, 'inventory.db')
+
+        if self.skus:
+            subprocess.check_call([sys.executable, os.path.join(backend_dir, 'generate_data.py'),
+                                   '--skus', str(self.skus), '--days', str(self.days),
+                                   '--seed', str(self.seed), '--path', db_path],
+                                  cwd=backend_dir, stderr=subprocess.DEVNULL)
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+
+        env = dict(os.environ, PORT=str(port), INVENTORY_DB=db_path,
+                   MODEL_CACHE_DIR=os.path.join(self.workdir, 'models'),
+                   SEED_SAMPLE_DATA='false' if self.skus else 'true')
+        env.pop('FLASK_ENV', None)
+        self.process = subprocess.Popen([sys.executable, os.path.join(backend_dir, 'app.py')],
+                                        cwd=self.workdir, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.url = f'http://127.0.0.1:{port}'
+
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if requests.get(f'{self.url}/health', timeout=1).ok:
+                    return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError('Server did not become healthy within 30s')
+
+    def __exit__(self, *exc):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+class LoadGenerator:
+    """Replay a weighted traffic mix at a Poisson arrival rate"""
+
+    def __init__(self, base_url, mix, rate, duration, max_workers=64, timeout=30, seed=None):
+        self.base_url = base_url.rstrip('/')
+        self.mix = mix
+        self.rate = rate
+        self.duration = duration
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.rng = random.Random(seed)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.service_times = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes_received = defaultdict(int)
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _send(self, name, method, path, body, scheduled):
+        sent = time.perf_counter()
+        ok = False
+        size = 0
+        try:
+            response = self._session().request(method, self.base_url + path, json=body, timeout=self.timeout)
+            ok = response.status_code < 400
+            size = len(response.content)
+        except requests.RequestException:
+            pass
+        done = time.perf_counter()
+
+        with self._lock:
+            self.latencies[name].append(done - scheduled)
+            self.service_times[name].append(done - sent)
+            self.bytes_received[name] += size
+            if not ok:
+                self.errors[name] += 1
+
+    def run(self, product_ids):
+        names = list(self.mix)
+        weights = [self.mix[n] for n in names]
+        futures = []
+
+        start = time.perf_counter()
+        next_arrival = start
+        end = start + self.duration
+        while True:
+            next_arrival += self.rng.expovariate(self.rate)
+            if next_arrival >= end:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            name = self.rng.choices(names, weights)[0]
+            method, path_fn, body_fn = ENDPOINTS[name]
+            path = path_fn(self.rng, product_ids)
+            body = body_fn(self.rng, product_ids) if body_fn else None
+            futures.append(self.executor.submit(self._send, name, method, path, body, next_arrival))
+
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        self.executor.shutdown()
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        endpoints = {}
+        all_latencies = []
+        for name in sorted(self.latencies):
+            latencies = sorted(self.latencies[name])
+            service = sorted(self.service_times[name])
+            all_latencies.extend(latencies)
+            endpoints[name] = {
+                'requests': len(latencies),
+                'errors': self.errors[name],
+                'error_rate': round(self.errors[name] / len(latencies), 4),
+                'throughput_rps': round(len(latencies) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2),
+                'service_p50_ms': round(percentile(service, 50) * 1000, 2),
+                'avg_response_bytes': round(self.bytes_received[name] / len(latencies))
+            }
+
+        all_latencies.sort()
+        total_errors = sum(self.errors.values())
+        return {
+            'offered_rate_rps': self.rate,
+            'duration_seconds': round(elapsed, 2),
+            'total': {
+                'requests': len(all_latencies),
+                'errors': total_errors,
+                'error_rate': round(total_errors / len(all_latencies), 4) if all_latencies else 0,
+                'throughput_rps': round(len(all_latencies) / elapsed, 2),
+                'p50_ms': round(percentile(all_latencies, 50) * 1000, 2) if all_latencies else None,
+                'p95_ms': round(percentile(all_latencies, 95) * 1000, 2) if all_latencies else None,
+                'p99_ms': round(percentile(all_latencies, 99) * 1000, 2) if all_latencies else None,
+            },
+            'endpoints': endpoints
+        }
+
+def print_report(report):
+    print(f"\nOffered {report['offered_rate_rps']} req/s for {report['duration_seconds']}s")
+    header = f"{'endpoint':<15}{'reqs':>8}{'err%':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes':>10}"
+    print(header)
+    print('-' * len(header))
+    for name, s in report['endpoints'].items():
+        print(f"{name:<15}{s['requests']:>8}{s['error_rate'] * 100:>8.2f}{s['throughput_rps']:>9.2f}"
+              f"{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['avg_response_bytes']:>10}")
+    t = report['total']
+    if t['requests']:
+        print('-' * len(header))
+        print(f"{'total':<15}{t['requests']:>8}{t['error_rate'] * 100:>8.2f}{t['throughput_rps']:>9.2f}"
+              f"{t['p50_ms']:>10.2f}{t['p95_ms']:>10.2f}{t['p99_ms']:>10.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Open-loop load test for the backend API')
+    parser.add_argument('--url', help='Target an already running server instead of starting one')
+    parser.add_argument('--rate', type=float, default=20, help='Arrival rate in requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='Test duration in seconds')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Weighted endpoint mix, e.g. inventory=5,forecast=2,batch=1')
+    parser.add_argument('--workers', type=int, default=64, help='Maximum concurrent in-flight requests')
+    parser.add_argument('--skus', type=int, default=0, help='Generate a synthetic dataset with this many SKUs')
+    parser.add_argument('--days', type=int, default=90, help='Days of history for the synthetic dataset')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the dataset and the arrival process')
+    parser.add_argument('--output', help='Write the report as JSON to this path')
+    args = parser.parse_args(argv)
+
+    def run(base_url):
+        inventory = requests.get(f'{base_url}/inventory', timeout=60).json().get('data', [])
+        product_ids = [item['productId'] for item in inventory] or ['PROD001']
+        generator = LoadGenerator(base_url, args.mix, args.rate, args.duration, args.workers, seed=args.seed)
+        return generator.run(product_ids)
+
+    if args.url:
+        report = run(args.url)
+    else:
+        with LocalServer(args.skus, args.days, args.seed) as server:
+            report = run(server.url)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report['total']['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,11 +2,25 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
+import threading
+import time
+import zlib
+from metrics import timed
 
 logger = logging.getLogger(__name__)
 
 class MarkdownOptimizer:
-    def __init__(self):
+    MODES = ('point', 'scenario')
+    
+    def __init__(self, mode='point', n_scenarios=2000, risk_quantile=None, demand_correlation=0.5):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown markdown mode: {mode}")
+        self.mode = mode
+        self.n_scenarios = n_scenarios
+        # None maximizes the expected score; a quantile such as 0.1 maximizes the worst-10% score
+        self.risk_quantile = risk_quantile
+        # Correlation of daily demand shocks within a scenario
+        self.demand_correlation = demand_correlation
         self.price_elasticity_estimates = {
             'Produce': -1.5,  # More elastic
             'Dairy': -1.2,
@@ -15,14 +29,72 @@ class MarkdownOptimizer:
             'Meat': -1.6,
             'default': -1.3
         }
+        # Estimated from sales history; see load_elasticities
+        self.sku_elasticities = {}
+        self.category_elasticities = {}
+        self._elasticity_lock = threading.Lock()
+        # Stored estimates to follow; see track_elasticities
+        self._elasticity_source = None
+        self._elasticity_version = None
+        self._elasticity_check_seconds = 0.0
+        self._next_elasticity_check = 0.0
+        self._elasticity_sync_lock = threading.Lock()
         
-    def calculate_price_elasticity(self, category):
-        """Get price elasticity estimate for a category"""
+    def load_elasticities(self, sku_elasticities, category_elasticities, version=None):
+        """Swap in estimated elasticities; both lookups are built first and replaced together"""
+        sku_elasticities = dict(sku_elasticities)
+        category_elasticities = dict(category_elasticities)
+        with self._elasticity_lock:
+            self.sku_elasticities, self.category_elasticities = sku_elasticities, category_elasticities
+            if version is not None:
+                self._elasticity_version = version
+        
+    def track_elasticities(self, source, check_seconds=5.0):
+        """Follow the estimates stored in source (a DataLoader) across processes.
+        
+        Lookups compare source.elasticity_version with the loaded one at most
+        every check_seconds and reload when another process has saved new
+        estimates.
+        """
+        self._elasticity_source = source
+        self._elasticity_check_seconds = check_seconds
+        self._next_elasticity_check = 0.0
+        self._sync_elasticities()
+        
+    def _sync_elasticities(self):
+        # One thread checks while the others keep using the loaded estimates
+        if not self._elasticity_sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_elasticity_check = time.monotonic() + self._elasticity_check_seconds
+            # Read the version before the rows; a save in between only causes one more reload
+            version = self._elasticity_source.elasticity_version
+            if version != self._elasticity_version:
+                self.load_elasticities(*self._elasticity_source.get_elasticities(), version=version)
+        except Exception as e:
+            logger.error(f"Error reloading price elasticities: {e}")
+        finally:
+            self._elasticity_sync_lock.release()
+        
+    def get_elasticities(self):
+        """The SKU and category lookups in use, read as one consistent pair"""
+        if self._elasticity_source is not None and time.monotonic() >= self._next_elasticity_check:
+            self._sync_elasticities()
+        with self._elasticity_lock:
+            return self.sku_elasticities, self.category_elasticities
+        
+    def calculate_price_elasticity(self, category, product_id=None):
+        """Get price elasticity for a product, falling back to its category estimate"""
+        sku_elasticities, category_elasticities = self.get_elasticities()
+        if product_id is not None and product_id in sku_elasticities:
+            return sku_elasticities[product_id]
+        if category in category_elasticities:
+            return category_elasticities[category]
         return self.price_elasticity_estimates.get(category, self.price_elasticity_estimates['default'])
         
-    def simulate_demand_response(self, base_demand, discount_percent, category):
+    def simulate_demand_response(self, base_demand, discount_percent, category, product_id=None):
         """Simulate how demand changes with discount"""
-        elasticity = self.calculate_price_elasticity(category)
+        elasticity = self.calculate_price_elasticity(category, product_id)
         
         # Price elasticity formula: % change in quantity / % change in price
         price_change_percent = -discount_percent  # Negative because price decreases
@@ -43,8 +115,16 @@ class MarkdownOptimizer:
         
         return max(0, potential_waste)
         
-    def optimize_markdown(self, product_data, forecast_data):
+    @timed('optimize_markdown')
+    def optimize_markdown(self, product_data, forecast_data, mode=None, risk_quantile=None):
         """Find optimal markdown percentage"""
+        mode = mode or self.mode
+        if mode == 'scenario':
+            return self.optimize_markdown_scenarios(product_data, forecast_data, risk_quantile)
+        return self._optimize_point(product_data, forecast_data)
+        
+    def _optimize_point(self, product_data, forecast_data):
+        """Optimize against the point forecast"""
         try:
             product_id = product_data['product_id']
             current_price = product_data['current_price']
@@ -79,7 +159,7 @@ class MarkdownOptimizer:
             
             for discount in discount_options:
                 # Calculate new demand with discount
-                new_demand = self.simulate_demand_response(predicted_demand, discount, category)
+                new_demand = self.simulate_demand_response(predicted_demand, discount, category, product_id)
                 
                 # Calculate units that will be sold
                 units_sold = min(current_stock, new_demand * days_until_expiry)
@@ -143,6 +223,88 @@ class MarkdownOptimizer:
             logger.error(f"Error optimizing markdown for product {product_data.get('product_id', 'unknown')}: {e}")
             return self._fallback_markdown(product_data)
             
+    def _sample_demand(self, forecast_data, horizon, rng):
+        """Sample (n_scenarios, horizon) daily demand paths from the forecast distribution"""
+        # Days past the forecast horizon repeat the forecast week
+        days = [forecast_data[i % len(forecast_data)] for i in range(horizon)]
+        mean = np.array([f['predicted'] for f in days], dtype=float)
+        # Upper bound is never clipped at zero, so it gives the spread directly
+        sigma = np.maximum(0.0, np.array([f['confidence_upper'] for f in days], dtype=float) - mean) / 1.96
+        
+        rho = self.demand_correlation
+        common = rng.standard_normal((self.n_scenarios, 1))
+        daily = rng.standard_normal((self.n_scenarios, horizon))
+        shocks = rho * common + np.sqrt(1 - rho ** 2) * daily
+        return np.maximum(0.0, mean + sigma * shocks)
+        
+    def optimize_markdown_scenarios(self, product_data, forecast_data, risk_quantile=None):
+        """Find the discount maximizing expected (or quantile) score over sampled demand scenarios"""
+        try:
+            days_until_expiry = product_data['days_until_expiry']
+            if not forecast_data or days_until_expiry <= 0:
+                # Nothing to sample from; the point optimizer handles these cases
+                return self._optimize_point(product_data, forecast_data)
+                
+            product_id = product_data['product_id']
+            current_price = product_data['current_price']
+            current_stock = product_data['stock']
+            elasticity = self.calculate_price_elasticity(product_data['category'], product_id)
+            risk_quantile = risk_quantile if risk_quantile is not None else self.risk_quantile
+            
+            # Seed from the product so repeated calls give the same recommendation
+            rng = np.random.default_rng(zlib.crc32(str(product_id).encode()))
+            total_demand = self._sample_demand(forecast_data, int(days_until_expiry), rng).sum(axis=1)
+            
+            # Evaluate every discount in every scenario at once: (discounts, scenarios)
+            discounts = np.array([0] + list(range(10, 71, 5)), dtype=float)
+            uplift = np.maximum(0.0, 1 + elasticity * -discounts / 100)[:, None]
+            units_sold = np.minimum(current_stock, uplift * total_demand[None, :])
+            revenue = units_sold * (current_price * (1 - discounts / 100))[:, None]
+            
+            baseline_sold = units_sold[0]
+            potential_waste = current_stock - baseline_sold
+            waste_reduction = units_sold - baseline_sold[None, :]
+            
+            urgency_factor = max(0.1, 1 - (days_until_expiry / 7))
+            waste_weight = 0.3 + (urgency_factor * 0.4)
+            revenue_weight = 1 - waste_weight
+            max_possible_revenue = current_stock * current_price
+            revenue_score = revenue / max_possible_revenue if max_possible_revenue > 0 else np.zeros_like(revenue)
+            waste_score = np.divide(waste_reduction, potential_waste[None, :],
+                                    out=np.zeros_like(waste_reduction), where=potential_waste[None, :] > 0)
+            scores = revenue_weight * revenue_score + waste_weight * waste_score
+            
+            objective = scores.mean(axis=1) if risk_quantile is None else np.quantile(scores, risk_quantile, axis=1)
+            best = int(np.argmax(objective))
+            
+            # Confidence: share of scenarios where the chosen discount is within 2% of that scenario's best
+            scenario_best = scores.max(axis=0)
+            confidence = float(np.mean(scores[best] >= scenario_best - 0.02 * np.abs(scenario_best)))
+            
+            units = units_sold[best]
+            waste_left = current_stock - units
+            return {
+                'product_id': product_id,
+                'optimal_discount': int(discounts[best]),
+                'projected_units_sold': round(float(units.mean()), 1),
+                'estimated_waste_reduction': round(float(waste_reduction[best].mean()), 1),
+                'revenue_impact': round(float(revenue[best].mean()), 2),
+                'confidence_score': round(confidence, 2),
+                'discounted_price': round(current_price * (1 - discounts[best] / 100), 2),
+                'potential_savings': round(float(waste_reduction[best].mean()) * current_price, 2),
+                'mode': 'scenario',
+                'scenarios': self.n_scenarios,
+                'risk_quantile': risk_quantile,
+                'units_sold_p10': round(float(np.quantile(units, 0.1)), 1),
+                'units_sold_p90': round(float(np.quantile(units, 0.9)), 1),
+                'expected_waste': round(float(waste_left.mean()), 1),
+                'waste_probability': round(float(np.mean(waste_left > 0.5)), 3)
+            }
+            
+        except Exception as e:
+            logger.error(f"Error optimizing markdown scenarios for product {product_data.get('product_id', 'unknown')}: {e}")
+            return self._fallback_markdown(product_data)
+            
     def _calculate_confidence(self, product_data, forecast_data, days_until_expiry):
         """Calculate confidence score for markdown recommendation"""
         confidence = 0.5  # Base confidence
@@ -194,15 +356,22 @@ class MarkdownOptimizer:
             'potential_savings': round(waste_reduction * current_price, 2)
         }
         
-    def batch_optimize(self, products_data, forecasts_data):
-        """Optimize markdowns for multiple products"""
+    def batch_optimize(self, products_data, forecasts_data, mode=None, risk_quantile=None):
+        """Optimize markdowns for multiple inventory lots.
+        
+        forecasts_data is keyed by (product_id, store_id), so each lot is judged
+        against its own store's demand, or by product_id for a single forecast.
+        """
         results = []
         
         for product in products_data:
             product_id = product['product_id']
-            forecast = forecasts_data.get(product_id, [])
+            store_id = product.get('store_id')
+            forecast = forecasts_data.get((product_id, store_id), forecasts_data.get(product_id, []))
             
-            result = self.optimize_markdown(product, forecast)
+            result = self.optimize_markdown(product, forecast, mode=mode, risk_quantile=risk_quantile)
+            if store_id is not None:
+                result['store_id'] = store_id
             results.append(result)
             
         return results
\ No newline at end of file
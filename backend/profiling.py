@@ -0,0 +1,131 @@
+import cProfile
+import pstats
+import threading
+import uuid
+import os
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from flask import g, request, jsonify
+
+logger = logging.getLogger(__name__)
+
+class RequestProfiler:
+    """Opt-in cProfile wrapper for single requests.
+
+    Hooks are only registered when profiling is enabled, so a disabled
+    profiler adds nothing to the request path. An enabled profiler only runs
+    for requests sending an ``X-Profile: 1`` header or ``?profile=1``.
+    """
+
+    def __init__(self, top_n=25, max_profiles=50):
+        self.top_n = top_n
+        self.max_profiles = max_profiles
+        self.profiles = OrderedDict()
+        self._lock = threading.Lock()
+        # cProfile cannot run concurrently on newer Pythons, so profile one request at a time
+        self._active = threading.Lock()
+
+    def init_app(self, app):
+        """Register request hooks and the /profiles endpoints on a Flask app"""
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/profiles', 'list_profiles', self._list_profiles, methods=['GET'])
+        app.add_url_rule('/profiles/<profile_id>', 'get_profile', self._get_profile, methods=['GET'])
+        logger.info("Request profiling enabled")
+
+    def _requested(self):
+        flag = request.headers.get('X-Profile') or request.args.get('profile')
+        return flag is not None and flag.lower() in ('1', 'true', 'yes')
+
+    def _start(self):
+        if not self._requested() or not self._active.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self._active.release()
+            return
+        g.profiler = profiler
+
+    def _finish(self, response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        self._active.release()
+
+        profile_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex
+        profile = {
+            'request_id': profile_id,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'timestamp': datetime.now().isoformat(),
+            **self.summarize(profiler)
+        }
+
+        with self._lock:
+            self.profiles[profile_id] = profile
+            while len(self.profiles) > self.max_profiles:
+                self.profiles.popitem(last=False)
+
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    def _teardown(self, error=None):
+        # Requests that failed before after_request still release the profiler
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            self._active.release()
+
+    def summarize(self, profiler):
+        """Get total time and the top-N functions by cumulative and by self time"""
+        stats = pstats.Stats(profiler)
+        entries = []
+        for (filename, line, name), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            entries.append({
+                'function': name,
+                'location': f'{os.path.basename(filename)}:{line}' if line else filename,
+                'calls': ncalls,
+                'total_time': round(tottime, 6),
+                'cumulative_time': round(cumtime, 6)
+            })
+        by_cumulative = sorted(entries, key=lambda e: e['cumulative_time'], reverse=True)
+        by_self = sorted(entries, key=lambda e: e['total_time'], reverse=True)
+        return {
+            'total_time': round(stats.total_tt, 6),
+            'hot_spots': by_cumulative[:self.top_n],
+            'self_time_hot_spots': by_self[:self.top_n]
+        }
+
+    def _list_profiles(self):
+        with self._lock:
+            profiles = [
+                {key: p[key] for key in ('request_id', 'method', 'path', 'status', 'timestamp', 'total_time')}
+                for p in reversed(self.profiles.values())
+            ]
+        return jsonify({
+            'success': True,
+            'data': profiles,
+            'count': len(profiles),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    def _get_profile(self, profile_id):
+        with self._lock:
+            profile = self.profiles.get(profile_id)
+        if profile is None:
+            return jsonify({
+                'success': False,
+                'error': f'Profile {profile_id} not found',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+        return jsonify({
+            'success': True,
+            'data': profile,
+            'timestamp': datetime.now().isoformat()
+        })
@@ -0,0 +1,154 @@
+import pandas as pd
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+class RecommendationCache:
+    """Per-SKU daily history, forecast and markdown suggestions held in memory.
+
+    apply_sales() folds a committed sales batch into the cached daily history
+    of the SKUs it touches, so those SKUs need no history query. refresh()
+    then recomputes forecasts and markdowns for the given SKUs only, with one
+    inventory query for all of them. SKUs outside the batch keep their entries.
+    Only refreshes driven by sales write suggestions to the database; filling
+    the cache for a read computes them without persisting.
+
+    Each entry records the data version and date it was computed for. Any
+    other write (for example from another worker process) advances the
+    version, and the entry is recomputed on its next read. The least recently
+    used entries are dropped beyond max_entries.
+    """
+
+    def __init__(self, data_loader, forecaster, markdown_optimizer, history_days=90, forecast_days=7,
+                 persist_suggestions=True, max_entries=10000):
+        self.data_loader = data_loader
+        self.forecaster = forecaster
+        self.markdown_optimizer = markdown_optimizer
+        self.history_days = history_days
+        self.forecast_days = forecast_days
+        self.persist_suggestions = persist_suggestions
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def _is_current(self, entry, version, today):
+        return entry is not None and entry['version'] == version and entry['date'] == today
+
+    def get(self, product_id):
+        """Entry for a product, recomputed when the data or the date changed; None if the product is unknown"""
+        version, today = self.data_loader.data_version, datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            entry = self.entries.get(product_id)
+            if self._is_current(entry, version, today):
+                self.entries.move_to_end(product_id)
+                return entry
+        return self.refresh([product_id], persist=False).get(product_id)
+
+    def apply_sales(self, sales_df, data_version):
+        """Add sales rows (date, product_id, units_sold, price) to cached histories; returns the product ids.
+        
+        Only entries computed at the version just before this batch's commit are
+        extended and moved to data_version. Others missed a write in between and
+        are dropped, so refresh() reloads them from the database.
+        """
+        daily = sales_df.groupby(['product_id', 'date'], as_index=False).agg(
+            units_sold=('units_sold', 'sum'), price=('price', 'mean'))
+        cutoff = (datetime.now() - timedelta(days=self.history_days)).strftime('%Y-%m-%d')
+
+        with self._lock:
+            for product_id, rows in daily.groupby('product_id', sort=False):
+                entry = self.entries.get(product_id)
+                if entry is None:
+                    continue
+                if entry['version'] != data_version - 1:
+                    del self.entries[product_id]
+                    continue
+                history = pd.concat([entry['history'], rows[['date', 'units_sold', 'price']]], ignore_index=True)
+                history = history.groupby('date', as_index=False).agg(units_sold=('units_sold', 'sum'),
+                                                                      price=('price', 'last'))
+                entry['history'] = history[history['date'] >= cutoff].reset_index(drop=True)
+                entry['version'] = data_version
+        return daily['product_id'].unique().tolist()
+
+    @timed('refresh_recommendations')
+    def refresh(self, product_ids, persist=True):
+        """Recompute forecast and markdown suggestions for the given products; persist=False skips saving them"""
+        product_ids = list(dict.fromkeys(product_ids))
+        if not product_ids:
+            return {}
+
+        # Read the version before any data: a write that lands while this runs leaves the
+        # entries tagged with the older version, so they are recomputed on their next read
+        version, today = self.data_loader.data_version, datetime.now().strftime('%Y-%m-%d')
+        # Only SKUs without a history at this version need it from the database
+        with self._lock:
+            histories = {pid: self.entries[pid]['history'] for pid in product_ids
+                         if pid in self.entries and self.entries[pid]['version'] == version}
+        missing = [pid for pid in product_ids if pid not in histories]
+        if missing:
+            loaded = self.data_loader.get_all_sales_history(days=self.history_days, product_ids=missing)
+            for product_id, rows in loaded.groupby('product_id', sort=False):
+                histories[product_id] = rows[['date', 'units_sold', 'price']].reset_index(drop=True)
+
+        inventory = {}
+        for item in self.data_loader.get_inventory_records(product_ids=product_ids):
+            inventory.setdefault(item['product_id'], []).append(item)
+        shares = self.data_loader.get_store_shares(list(inventory))
+
+        refreshed = {}
+        suggestions = []
+        for product_id in product_ids:
+            items = inventory.get(product_id)
+            if not items:
+                continue
+            history = histories.get(product_id, pd.DataFrame(columns=['date', 'units_sold', 'price']))
+            forecast = []
+            if not history.empty or self.forecaster.model_type == 'global':
+                forecast = self.forecaster.forecast(product_id, history.copy(), days=self.forecast_days,
+                                                    category=items[0]['category'])
+            # Each lot is optimized against its own store's share of the product forecast
+            store_forecasts = self.forecaster.split_by_store(forecast, shares.get(product_id),
+                                                             [item['store_id'] for item in items])
+            markdowns = self.markdown_optimizer.batch_optimize(
+                items, {(product_id, store_id): f for store_id, f in store_forecasts.items()})
+            suggestions.extend(markdowns)
+            refreshed[product_id] = {
+                'history': history,
+                'forecast': forecast,
+                'markdown': markdowns,
+                'updated_at': datetime.now().isoformat(),
+                'version': version,
+                'date': today
+            }
+
+        with self._lock:
+            for product_id, entry in refreshed.items():
+                # Keep an entry a concurrent refresh computed from newer data
+                current = self.entries.get(product_id)
+                if current is None or current['version'] <= version:
+                    self.entries[product_id] = entry
+                self.entries.move_to_end(product_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.refreshes += len(refreshed)
+        if persist and self.persist_suggestions and suggestions:
+            saved_version = self.data_loader.save_markdown_suggestions(suggestions)
+            # Saving is a write too; if nothing else wrote in between, the entries are still current
+            if saved_version == version + 1:
+                with self._lock:
+                    for product_id, entry in refreshed.items():
+                        if self.entries.get(product_id) is entry:
+                            entry['version'] = saved_version
+        return refreshed
+
+    def on_sales_committed(self, sales_df, data_version):
+        """Ingestion listener: update only the SKUs in the committed batch"""
+        self.refresh(self.apply_sales(sales_df, data_version))
+
+    def get_stats(self):
+        return {'cached_products': len(self.entries), 'max_entries': self.max_entries, 'refreshes': self.refreshes}
@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import functools
+import threading
+import time
+import logging
+from collections import OrderedDict
+from flask import request, make_response, Response
+from metrics import response_cache as response_cache_results
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ('body', 'gzip_body', 'etag', 'mimetype', 'created')
+
+    def __init__(self, body, gzip_body, etag, mimetype):
+        self.body = body
+        self.gzip_body = gzip_body
+        self.etag = etag
+        self.mimetype = mimetype
+        self.created = time.monotonic()
+
+class ResponseCache:
+    """Serialized GET responses keyed by path, query args and data version.
+
+    version() returns a value that changes whenever the data behind the cached
+    views changes. Entries from older versions are dropped on the next miss,
+    so nothing is served stale and memory stays bounded. Each entry keeps the
+    body both as-is and gzip-compressed, plus a strong ETag. A request whose
+    If-None-Match matches gets an empty 304. Concurrent misses for the same
+    key render the view once. Entries also expire after ttl seconds, which
+    bounds staleness after writes that bypass the version (0 disables it).
+    """
+
+    def __init__(self, version, max_entries=1024, ttl=30.0, min_gzip_bytes=512, compress_level=6):
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_gzip_bytes = min_gzip_bytes
+        self.compress_level = compress_level
+        self.entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def cached(self, view):
+        """Decorator serving a view's 200 responses from the cache"""
+        if self.max_entries <= 0:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = self.version()
+            key = (version, request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = self._get(key)
+            if entry is not None:
+                response_cache_results.inc(result='hit')
+            else:
+                uncached = {}
+                entry = self._flight.do(key, lambda: self._render(view, args, kwargs, key, uncached))
+                if entry is None:
+                    # Error responses are not cached; callers that waited on one render their own
+                    return uncached.get('response') or view(*args, **kwargs)
+                response_cache_results.inc(result='miss')
+            return self._respond(entry)
+        return wrapper
+
+    def _get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry.created > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def _render(self, view, args, kwargs, key, uncached):
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            uncached['response'] = response
+            return None
+
+        body = response.get_data()
+        gzip_body = None
+        if len(body) >= self.min_gzip_bytes:
+            gzip_body = gzip.compress(body, compresslevel=self.compress_level, mtime=0)
+        entry = _Entry(body, gzip_body, hashlib.blake2b(body, digest_size=16).hexdigest(), response.mimetype)
+
+        with self._lock:
+            if self._version is None or key[0] > self._version:
+                # Data changed; nothing cached under an older version can be served again
+                self.entries.clear()
+                self._version = key[0]
+            if key[0] == self._version:
+                self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def _respond(self, entry):
+        use_gzip = entry.gzip_body is not None and 'gzip' in request.accept_encodings
+        # Strong ETags identify one representation, so the gzip body gets its own tag
+        etag = f'{entry.etag}-gzip' if use_gzip else entry.etag
+
+        # If-None-Match uses weak comparison, so a tag from either representation validates
+        if request.if_none_match.contains_weak(entry.etag) or request.if_none_match.contains_weak(f'{entry.etag}-gzip'):
+            response_cache_results.inc(result='not_modified')
+            response = Response(status=304)
+        elif use_gzip:
+            response = Response(entry.gzip_body, mimetype=entry.mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(entry.body, mimetype=entry.mimetype)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': sum(len(e.body) + len(e.gzip_body or b'') for e in self.entries.values()),
+                'coalesced': self._flight.get_stats()['coalesced']
+            }
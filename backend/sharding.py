@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Hash-sharded product partitioning.
+
+Products are assigned to shards by consistent hashing. Each shard is an
+ordinary backend process (SHARD_ID set) with its own database, model
+directory and archive. A router process (SHARDS set, SHARD_ID unset) forwards
+per-product requests to the owning shard and merges fan-out requests.
+
+Examples:
+    # Generate 1,000 SKUs split across two shards, then start both shards and a router
+    python generate_data.py --skus 1000 --days 90 --shards shard0,shard1 --path data/shards --replace
+    python sharding.py --shards shard0,shard1 --base-port 5001 --router-port 5000
+"""
+import argparse
+import bisect
+import hashlib
+import heapq
+import os
+import subprocess
+import sys
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from flask import request, jsonify, Response
+from ingestion import SalesIngestor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_shards(spec):
+    """Parse 'shard0=http://host:5001,shard1=http://host:5002' into an ordered {name: url} dict"""
+    shards = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, sep, url = part.partition('=')
+        if not sep or not name or not url:
+            raise ValueError(f"Invalid shard '{part}', expected name=url")
+        shards[name.strip()] = url.strip().rstrip('/')
+    return shards
+
+class HashRing:
+    """Consistent-hash ring mapping product ids to shard names.
+
+    Each shard owns `vnodes` points on a 64-bit ring, and a product belongs to
+    the first point at or after its own hash. Adding or removing a shard only
+    moves the products in the arcs that shard gains or loses, about 1/N of
+    the catalog, so the other shards keep their data and trained models.
+    """
+
+    def __init__(self, shards, vnodes=128):
+        if not shards:
+            raise ValueError('At least one shard is required')
+        self.shards = list(shards)
+        points = sorted((self._hash(f'{shard}#{i}'), shard) for shard in self.shards for i in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+    def shard_for(self, product_id):
+        index = bisect.bisect_left(self._points, self._hash(str(product_id)))
+        return self._owners[index % len(self._owners)]
+
+    def partition(self, product_ids):
+        """Group product ids by owning shard, keeping their order"""
+        groups = {}
+        for product_id in product_ids:
+            groups.setdefault(self.shard_for(product_id), []).append(product_id)
+        return groups
+
+class ShardError(Exception):
+    """A shard could not be reached or returned an unusable response"""
+
+    def __init__(self, shard, message):
+        super().__init__(f"Shard {shard}: {message}")
+        self.shard = shard
+
+class ShardRouter:
+    """Route API requests across shard processes.
+
+    Requests whose URL carries a product_id go to the owning shard unchanged,
+    including If-None-Match, so shard ETags and 304s pass through.
+    /inventory, /analytics/summary, /markdown/batch, /sales and /jobs are
+    split or fanned out and their results merged. Batch jobs started on
+    several shards get a composite id that /jobs resolves on each shard. Other
+    data endpoints answer 501 on the router.
+    """
+
+    LOCAL_ENDPOINTS = {'health_check', 'get_metrics', 'list_shards', 'static'}
+
+    def __init__(self, ring, urls, timeout=30.0, sync_limit=100):
+        self.ring = ring
+        self.urls = urls
+        self.timeout = timeout
+        self.sync_limit = sync_limit
+        self._pool = ThreadPoolExecutor(max_workers=max(4, 2 * len(urls)), thread_name_prefix='shard-router')
+        self._local = threading.local()
+        self.fan_out = {
+            'get_inventory': self._gather_inventory,
+            'get_analytics_summary': self._gather_analytics,
+            'get_batch_markdown': self._scatter_markdown_batch,
+            'ingest_sales': self._scatter_sales,
+            'get_job': self._gather_job
+        }
+
+    def init_app(self, app):
+        """Register the routing hook and GET /shards on a Flask app"""
+        app.before_request(self._route)
+        app.add_url_rule('/shards', 'list_shards', self._list_shards, methods=['GET'])
+        logger.info(f"Routing requests across {len(self.urls)} shard(s): {', '.join(self.urls)}")
+
+    def _session(self):
+        # requests sessions pool connections but are not thread-safe, so keep one per thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _error(self, message, status):
+        return jsonify({
+            'success': False,
+            'error': message,
+            'timestamp': datetime.now().isoformat()
+        }), status
+
+    def _route(self):
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in self.LOCAL_ENDPOINTS:
+            return None
+        try:
+            product_id = (request.view_args or {}).get('product_id')
+            if product_id is not None:
+                return self._forward(self.ring.shard_for(product_id))
+            handler = self.fan_out.get(endpoint)
+            if handler is None:
+                return self._error(f'{request.path} is not available through the shard router', 501)
+            return handler()
+        except ShardError as e:
+            logger.error(f"Routing {request.path} failed: {e}")
+            return self._error(str(e), 502)
+        except Exception as e:
+            logger.error(f"Routing {request.path} failed: {e}")
+            return self._error(str(e), 500)
+
+    def _request(self, shard, method, path, **kwargs):
+        headers = kwargs.pop('headers', {})
+        # Shard bodies are re-served or merged here, so ask for them uncompressed
+        headers['Accept-Encoding'] = 'identity'
+        try:
+            return self._session().request(method, self.urls[shard] + path, headers=headers,
+                                           timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise ShardError(shard, str(e))
+
+    def _forward(self, shard):
+        headers = {}
+        for name in ('Content-Type', 'If-None-Match'):
+            if name in request.headers:
+                headers[name] = request.headers[name]
+        path = request.path + (f'?{request.query_string.decode()}' if request.query_string else '')
+        upstream = self._request(shard, request.method, path, data=request.get_data(), headers=headers)
+
+        response = Response(upstream.content, status=upstream.status_code,
+                            content_type=upstream.headers.get('Content-Type'))
+        for name in ('ETag', 'Cache-Control', 'Vary'):
+            if name in upstream.headers:
+                response.headers[name] = upstream.headers[name]
+        response.headers['X-Shard'] = shard
+        return response
+
+    def _scatter(self, calls):
+        """Run {shard: (method, path, kwargs)} concurrently; returns {shard: (status, json)}"""
+        futures = {shard: self._pool.submit(self._request, shard, method, path, **kwargs)
+                   for shard, (method, path, kwargs) in calls.items()}
+        results = {}
+        for shard, future in futures.items():
+            response = future.result()
+            try:
+                results[shard] = (response.status_code, response.json())
+            except ValueError:
+                raise ShardError(shard, f'non-JSON response with status {response.status_code}')
+        return results
+
+    def _all_shards(self, method, path, **kwargs):
+        return self._scatter({shard: (method, path, kwargs) for shard in self.urls})
+
+    def _require_ok(self, results, expected=(200,)):
+        for shard, (status, body) in results.items():
+            if status not in expected:
+                raise ShardError(shard, body.get('error') or f'status {status}')
+
+    def _query_path(self):
+        return request.path + (f'?{request.query_string.decode()}' if request.query_string else '')
+
+    def _gather_inventory(self):
+        results = self._all_shards('GET', self._query_path())
+        self._require_ok(results)
+        # Inventory ids are only unique within a shard, so qualify them with the shard name
+        for shard, (_, body) in results.items():
+            for item in body['data']:
+                item['shard'] = shard
+                item['inventoryId'] = f"{shard}:{item['inventoryId']}"
+        # Each shard's list is ordered by expiry date, so a merge keeps the global order
+        items = list(heapq.merge(*(body['data'] for _, body in results.values()), key=lambda i: i['expiryDate']))
+        return jsonify({
+            'success': True,
+            'data': items,
+            'count': len(items),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    def _gather_analytics(self):
+        results = self._all_shards('GET', self._query_path())
+        self._require_ok(results)
+        summary = {}
+        for _, body in results.values():
+            _add_numbers(summary, body['data'])
+        for section in ('inventory_overview', 'waste_prevention'):
+            for key, value in summary.get(section, {}).items():
+                if isinstance(value, float):
+                    summary[section][key] = round(value, 2)
+        return jsonify({
+            'success': True,
+            'data': summary,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    def _scatter_markdown_batch(self):
+        data = request.get_json(silent=True) or {}
+        product_ids = (data.get('product_ids') or []) if isinstance(data, dict) else None
+        # Ids are hashed to shards before any shard sees them, so they are checked here as well
+        if not isinstance(product_ids, list) or not all(isinstance(pid, str) and pid for pid in product_ids):
+            return self._error('product_ids must be a list of product id strings', 400)
+        if not product_ids:
+            # Same default as a single node: everything expiring within 3 days, on every shard
+            results = self._all_shards('GET', '/inventory?expiry_days=3')
+            self._require_ok(results)
+            product_ids = [item['productId'] for _, body in results.values() for item in body['data']]
+            if not product_ids:
+                return jsonify({'success': True, 'data': [], 'count': 0, 'timestamp': datetime.now().isoformat()})
+
+        # Decide sync or async once for the whole batch so shards never mix the two
+        run_async = bool(data.get('async')) or len(product_ids) > self.sync_limit
+        calls = {shard: ('POST', '/markdown/batch', {'json': dict(data, product_ids=ids, **{'async': run_async})})
+                 for shard, ids in self.ring.partition(product_ids).items()}
+        results = self._scatter(calls)
+        for status, body in results.values():
+            if status == 400:
+                return jsonify(body), 400
+        self._require_ok(results, expected=(202,) if run_async else (200,))
+
+        if run_async:
+            job_id = ','.join(f"{shard}:{body['data']['job_id']}" for shard, (_, body) in results.items())
+            return jsonify({
+                'success': True,
+                'data': {
+                    'job_id': job_id,
+                    'status': 'pending',
+                    'total': len(product_ids),
+                    'status_url': f'/jobs/{job_id}'
+                },
+                'timestamp': datetime.now().isoformat()
+            }), 202
+
+        # Return suggestions in the order the products were requested
+        by_product = {}
+        for _, body in results.values():
+            for result in body['data']:
+                by_product.setdefault(result['product_id'], []).append(result)
+        merged = [result for product_id in dict.fromkeys(product_ids) for result in by_product.get(product_id, [])]
+        return jsonify({
+            'success': True,
+            'data': merged,
+            'count': len(merged),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    def _gather_job(self):
+        job_id = request.view_args['job_id']
+        parts = [part.split(':', 1) for part in job_id.split(',')]
+        if any(len(part) != 2 or part[0] not in self.urls for part in parts):
+            return self._error(f'Job {job_id} not found', 404)
+
+        query = f'?{request.query_string.decode()}' if request.query_string else ''
+        results = self._scatter({shard: ('GET', f'/jobs/{shard_job}{query}', {}) for shard, shard_job in parts})
+        for status, body in results.values():
+            if status == 404:
+                return self._error(f'Job {job_id} not found', 404)
+        self._require_ok(results)
+
+        jobs = [body['data'] for _, body in results.values()]
+        statuses = {job['status'] for job in jobs}
+        total = sum(job['total'] for job in jobs)
+        processed = sum(job['processed'] for job in jobs)
+        merged = {
+            'job_id': job_id,
+            'job_type': jobs[0]['job_type'],
+            'status': 'failed' if 'failed' in statuses else 'completed' if statuses == {'completed'}
+                      else 'running' if statuses & {'running', 'completed'} else 'pending',
+            'total': total,
+            'processed': processed,
+            'progress': round(processed / total, 4) if total else 1.0,
+            'error': '; '.join(job['error'] for job in jobs if job.get('error')) or None,
+            'created_at': min(job['created_at'] for job in jobs),
+            'updated_at': max(job['updated_at'] for job in jobs),
+            'shards': {shard: body['data']['status'] for shard, (_, body) in results.items()}
+        }
+        if all('results' in job for job in jobs):
+            merged['results'] = [result for job in jobs for result in job['results']]
+        return jsonify({
+            'success': True,
+            'data': merged,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    def _scatter_sales(self):
+        data = request.get_json(silent=True)
+        events = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(events, list) or not events:
+            return self._error('Expected a non-empty list of events', 400)
+
+        # Validate everything first so a bad event rejects the whole request on every shard
+        today = datetime.now().strftime('%Y-%m-%d')
+        groups = {}
+        for i, event in enumerate(events):
+            try:
+                SalesIngestor.parse_event(event, today)
+            except (ValueError, TypeError) as e:
+                return self._error(f'Invalid event at index {i}: {e}', 400)
+            groups.setdefault(self.ring.shard_for(str(event['product_id'])), []).append(event)
+
+        flush = isinstance(data, dict) and bool(data.get('flush'))
+        results = self._scatter({shard: ('POST', '/sales', {'json': {'events': shard_events, 'flush': flush}})
+                                 for shard, shard_events in groups.items()})
+        self._require_ok(results, expected=(202,))
+        return jsonify({
+            'success': True,
+            'data': {
+                'accepted': sum(body['data']['accepted'] for _, body in results.values()),
+                'ingestion': {shard: body['data']['ingestion'] for shard, (_, body) in results.items()}
+            },
+            'timestamp': datetime.now().isoformat()
+        }), 202
+
+    def _list_shards(self):
+        """Shard names, URLs and health; ?product_id= also reports the owning shard"""
+        def check(shard):
+            try:
+                return self._session().get(f'{self.urls[shard]}/health', timeout=2).ok
+            except requests.RequestException:
+                return False
+
+        healthy = dict(zip(self.urls, self._pool.map(check, self.urls)))
+        data = {'shards': [{'name': shard, 'url': url, 'healthy': healthy[shard]} for shard, url in self.urls.items()]}
+        product_id = request.args.get('product_id')
+        if product_id:
+            data['owner'] = self.ring.shard_for(product_id)
+        return jsonify({
+            'success': True,
+            'data': data,
+            'timestamp': datetime.now().isoformat()
+        })
+
+def _add_numbers(total, part):
+    """Add the numbers in nested dict `part` into `total` in place"""
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _add_numbers(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+        else:
+            total.setdefault(key, value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run shard processes and a router on this machine')
+    parser.add_argument('--shards', default='shard0,shard1', help='Comma-separated shard names')
+    parser.add_argument('--base-port', type=int, default=5001, help='Port of the first shard')
+    parser.add_argument('--router-port', type=int, default=5000, help='Router port')
+    parser.add_argument('--data-dir', default='data/shards', help='Directory holding one subdirectory per shard')
+    args = parser.parse_args(argv)
+
+    names = [name for name in args.shards.split(',') if name]
+    urls = {name: f'http://127.0.0.1:{args.base_port + i}' for i, name in enumerate(names)}
+    shards_env = ','.join(f'{name}={url}' for name, url in urls.items())
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+    processes = []
+    for i, name in enumerate(names):
+        env = dict(os.environ, SHARD_ID=name, SHARDS=shards_env, SHARD_DATA_DIR=args.data_dir,
+                   PORT=str(args.base_port + i))
+        processes.append(subprocess.Popen([sys.executable, app_path], env=env))
+    env = dict(os.environ, SHARDS=shards_env, PORT=str(args.router_port))
+    processes.append(subprocess.Popen([sys.executable, app_path], env=env))
+    logger.info(f"Router on port {args.router_port}, shards: {shards_env}")
+
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+if __name__ == '__main__':
+    main()
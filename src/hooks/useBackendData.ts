@@ -27,6 +27,22 @@ export const useInventoryData = (filters?: { category?: string; expiry_days?: nu
     fetchData();
   }, [filters?.category, filters?.expiry_days]);
 
+  // Apply pushed stock changes in place instead of re-downloading the inventory
+  useEffect(() => {
+    const unsubscribeInventory = apiService.subscribeToChanges('inventory', changes => {
+      const byId = new Map(changes.map(change => [change.inventoryId, change] as const));
+      setData(prev => prev.map(item => {
+        const change = item.inventoryId !== undefined ? byId.get(item.inventoryId) : undefined;
+        return change ? { ...item, stock: change.stock, status: change.status } : item;
+      }));
+    });
+    const unsubscribeReset = apiService.subscribeToChanges('reset', () => fetchData());
+    return () => {
+      unsubscribeInventory();
+      unsubscribeReset();
+    };
+  }, [filters?.category, filters?.expiry_days]);
+
   return { data, loading, error, refetch: fetchData };
 };
 
@@ -107,17 +123,28 @@ export const useMarkdownData = (productIds?: string[]) => {
     }
   }, [productIds?.join(',')]);
 
+  // Replace suggestions for products on screen when the server recomputes them
+  useEffect(() => {
+    return apiService.subscribeToChanges('markdown', suggestions => {
+      const latest = new Map(suggestions.map(suggestion => [suggestion.product_id, suggestion] as const));
+      setData(prev => prev.map(item => latest.get(item.product_id) ?? item));
+    });
+  }, []);
+
   return { data, loading, error, refetch: fetchData, fetchSingleMarkdown };
 };
 
+// Inventory events arriving within this window share one analytics refetch
+const ANALYTICS_REFETCH_DELAY_MS = 1000;
+
 export const useAnalyticsData = () => {
   const [data, setData] = useState<AnalyticsSummary | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
-  const fetchData = async () => {
+  const fetchData = async (showLoading: boolean = true) => {
     try {
-      setLoading(true);
+      if (showLoading) setLoading(true);
       setError(null);
       const response = await apiService.getAnalyticsSummary();
       if (response.success && response.data) {
@@ -134,6 +161,21 @@ export const useAnalyticsData = () => {
 
   useEffect(() => {
     fetchData();
+    // Stock and status changes move the totals, so refresh them in the background after inventory events
+    let refetchTimer: ReturnType<typeof setTimeout> | undefined;
+    const unsubscribeInventory = apiService.subscribeToChanges('inventory', () => {
+      if (refetchTimer !== undefined) return;
+      refetchTimer = setTimeout(() => {
+        refetchTimer = undefined;
+        fetchData(false);
+      }, ANALYTICS_REFETCH_DELAY_MS);
+    });
+    const unsubscribeReset = apiService.subscribeToChanges('reset', () => fetchData());
+    return () => {
+      clearTimeout(refetchTimer);
+      unsubscribeInventory();
+      unsubscribeReset();
+    };
   }, []);
 
   return { data, loading, error, refetch: fetchData };
@@ -157,9 +199,10 @@ export const useBackendHealth = () => {
 
   useEffect(() => {
     checkHealth();
-    // Check health every 30 seconds
-    const interval = setInterval(checkHealth, 30000);
-    return () => clearInterval(interval);
+    // The change feed sends a status event on connect and as a heartbeat, so no polling is needed
+    return apiService.subscribeToChanges('status', status => {
+      setIsHealthy(status.status === 'healthy');
+    });
   }, []);
 
   return { isHealthy, loading, checkHealth };
@@ -8,9 +8,11 @@ export interface ApiResponse<T> {
 }
 
 export interface InventoryItem {
+  inventoryId?: number;
   productId: string;
   productName: string;
   category: string;
+  storeId?: string;
   stock: number;
   expiryDate: string;
   currentPrice: number;
@@ -74,7 +76,30 @@ export interface AnalyticsSummary {
   }>;
 }
 
+export interface InventoryChange {
+  inventoryId: number;
+  productId: string;
+  storeId: string;
+  stock: number;
+  status: InventoryItem['status'];
+}
+
+export interface ChangeFeedEvents {
+  inventory: InventoryChange[];
+  markdown: MarkdownSuggestion[];
+  status: { status: string; version?: string; timestamp: string };
+  reset: { reason: string };
+}
+
+export type ChangeFeedEventType = keyof ChangeFeedEvents;
+
+const CHANGE_FEED_EVENTS: ChangeFeedEventType[] = ['inventory', 'markdown', 'status', 'reset'];
+
 class ApiService {
+  // One shared server-sent event connection for every subscriber
+  private changeFeed: EventSource | null = null;
+  private changeHandlers = new Map<ChangeFeedEventType, Set<(data: unknown) => void>>();
+
   private async request<T>(endpoint: string, options?: RequestInit): Promise<ApiResponse<T>> {
     try {
       const response = await fetch(`${API_BASE_URL}${endpoint}`, {
@@ -144,6 +169,47 @@ class ApiService {
     return this.request('/analytics/summary');
   }
 
+  // Change feed
+  private dispatchChange(type: ChangeFeedEventType, data: unknown) {
+    this.changeHandlers.get(type)?.forEach(handler => handler(data));
+  }
+
+  private openChangeFeed(): EventSource {
+    const source = new EventSource(`${API_BASE_URL}/events`);
+    CHANGE_FEED_EVENTS.forEach(type => {
+      source.addEventListener(type, event => {
+        this.dispatchChange(type, JSON.parse(event.data));
+      });
+    });
+    // EventSource reconnects on its own and sends Last-Event-ID, so missed changes are replayed
+    source.onerror = () => {
+      this.dispatchChange('status', { status: 'unreachable', timestamp: new Date().toISOString() });
+    };
+    return source;
+  }
+
+  subscribeToChanges<K extends ChangeFeedEventType>(
+    type: K,
+    handler: (data: ChangeFeedEvents[K]) => void
+  ): () => void {
+    const listener = handler as (data: unknown) => void;
+    const handlers = this.changeHandlers.get(type) ?? new Set<(data: unknown) => void>();
+    handlers.add(listener);
+    this.changeHandlers.set(type, handlers);
+    if (!this.changeFeed) {
+      this.changeFeed = this.openChangeFeed();
+    }
+
+    return () => {
+      handlers.delete(listener);
+      const active = [...this.changeHandlers.values()].some(set => set.size > 0);
+      if (!active && this.changeFeed) {
+        this.changeFeed.close();
+        this.changeFeed = null;
+      }
+    };
+  }
+
   // Sales history
   async getSalesHistory(productId: string, days: number = 30): Promise<ApiResponse<{
     product_id: string;